@@ -1,6 +1,10 @@
 import asyncio
 
-from core import Asahi
+from core import Asahi, Launcher
+from exts import Config
 
 if __name__ == "__main__":
-    asyncio.run(Asahi().startup())
+    if Config().get("cluster_count", 1) > 1:
+        Launcher(Config()).run()
+    else:
+        asyncio.run(Asahi().startup())
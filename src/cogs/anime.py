@@ -1,5 +1,4 @@
 from discord.ext import commands
-import discord
 
 from core import Asahi, AsahiContext
 
@@ -12,45 +11,33 @@ class Anime(
     def __init__(self, bot: Asahi):
         self.bot = bot
 
+    async def cog_load(self):
+        self.bot.image_pool.prefetch(*(c.name for c in self.get_commands()))
+
     @commands.command()
     async def waifu(self, ctx: AsahiContext):
         "Random anime waifu images"
-        async with self.bot.session.get("https://api.waifu.im/random/?selected_tags=waifu") as resp:
-            await ctx.send(
-                embed=discord.Embed(color=self.bot.ok_color).set_image(url=(await resp.json())["images"][0]["url"])
-            )
+        await ctx.send_image()
 
     @commands.command()
     async def mori(self, ctx: AsahiContext):
         "Random images of VTuber Mori Calliope"
-        async with self.bot.session.get("https://api.waifu.im/random/?selected_tags=mori-calliope") as resp:
-            await ctx.send(
-                embed=discord.Embed(color=self.bot.ok_color).set_image(url=(await resp.json())["images"][0]["url"])
-            )
+        await ctx.send_image()
 
     @commands.command()
     async def marin(self, ctx: AsahiContext):
         """Pictures of Dress Up Darling character Marin Kitagawa"""
-        async with self.bot.session.get("https://api.waifu.im/random/?selected_tags=marin-kitagawa") as resp:
-            await ctx.send(
-                embed=discord.Embed(color=self.bot.ok_color).set_image(url=(await resp.json())["images"][0]["url"])
-            )
+        await ctx.send_image()
 
     @commands.command()
     async def maid(self, ctx: AsahiContext):
         """Random pictures of anime maids"""
-        async with self.bot.session.get("https://api.waifu.im/random/?selected_tags=maid") as resp:
-            await ctx.send(
-                embed=discord.Embed(color=self.bot.ok_color).set_image(url=(await resp.json())["images"][0]["url"])
-            )
+        await ctx.send_image()
 
     @commands.command()
     async def selfie(self, ctx: AsahiContext):
         """Random anime selfies"""
-        async with self.bot.session.get("https://api.waifu.im/random/?selected_tags=selfie") as resp:
-            await ctx.send(
-                embed=discord.Embed(color=self.bot.ok_color).set_image(url=(await resp.json())["images"][0]["url"])
-            )
+        await ctx.send_image()
 
 
 async def setup(bot: Asahi):
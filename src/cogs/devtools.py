@@ -4,16 +4,20 @@ from datetime import datetime
 from subprocess import PIPE
 from typing import Optional
 import asyncio
+import heapq
 import io
 import os
 import re
 import textwrap
+import time
 import traceback
 
 from discord.ext import commands
 import discord
+import humanize
+import psutil
 
-from core import Asahi, AsahiContext
+from core import Asahi, AsahiContext, guild_memory
 
 START_CODE_BLOCK_RE = re.compile(r"^((```py(thon)?)(?=\s)|(```))")
 
@@ -24,7 +28,6 @@ class DevTools(commands.Cog):
     def __init__(self, bot: Asahi):
         self.bot = bot
         self._last_result = None
-        self.socket_stats = Counter()
 
     @staticmethod
     def cleanup_code(content) -> str:
@@ -36,18 +39,259 @@ class DevTools(commands.Cog):
         # remove `foo`
         return content.strip("` \n")
 
-    @commands.Cog.listener("on_socket_event_type")
-    async def websocket_listener(self, event: str):
-        self.socket_stats[event] += 1
-
     @commands.command()
     @commands.is_owner()
     async def wsstats(self, ctx: AsahiContext):
-        """Show a list of websocket events and the amount they've been dispatched"""
+        """Show a list of websocket events and the amount they've been dispatched across all clusters"""
+        matcher = self.bot.prefix_matcher
+        events = Counter()
+        for cluster in await self.bot.global_stats():
+            events.update(cluster["events"])
+        await ctx.send(
+            embed=discord.Embed(
+                title=f"Total Observed WebSocket Events : {events.total()}",
+                description="\n".join([f"`{n}`: **{i}**" for n, i in events.most_common()]),
+                color=self.bot.info_color,
+            ).set_footer(
+                text=f"Prefix filter: {matcher.dispatched} dispatched | {matcher.rejected} rejected "
+                f"({round(matcher.reject_rate * 100, 1)}% skipped)"
+            )
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def clusters(self, ctx: AsahiContext):
+        """Show guilds, latency, commands and memory for every cluster"""
+        clusters = await self.bot.global_stats()
+        await ctx.send(
+            embed=discord.Embed(
+                title=f"Clusters | {len(clusters)} reporting",
+                description="\n".join(
+                    f"`#{c['cluster']}` shards {c['shards'][0]}-{c['shards'][-1]}: **{c['guilds']}** guilds | "
+                    f"{c['users']} users | {round(c['latency'] * 1000)}ms | {c['commands']} commands | "
+                    f"{humanize.naturalsize(c['memory'])}"
+                    for c in clusters
+                ),
+                color=self.bot.info_color,
+            ).set_footer(text=f"This is cluster #{self.bot.cluster_id}")
+        )
+
+    @commands.command(aliases=["imgpool"])
+    @commands.is_owner()
+    async def imagepool(self, ctx: AsahiContext):
+        """Show the prefetched image pool sizes and their hit/miss counts per image command"""
+        stats = self.bot.image_pool.stats()
+        hits = sum(s[2] for s in stats)
+        total = hits + sum(s[3] for s in stats)
+        await ctx.send(
+            embed=discord.Embed(
+                title=(
+                    f"Image Pool | Hit Rate: {round(hits / total * 100, 1) if total else 0}% | "
+                    f"Hedged Requests: {self.bot.image_pool.hedges}"
+                ),
+                description="\n".join(
+                    [f"`{key}`: **{size}** pooled | {hit} hits | {miss} misses" for key, size, hit, miss in stats]
+                )
+                or "Nothing has been pooled yet.",
+                color=self.bot.info_color,
+            )
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def httpstats(self, ctx: AsahiContext):
+        """Show request latency, error counts and circuit state for each upstream host"""
+        await ctx.send(
+            embed=discord.Embed(
+                title="Upstream HTTP Stats",
+                description="\n".join(
+                    [
+                        f"`{host}` [{self.bot.web.breaker(host).state}]: **{s.requests}** requests | "
+                        f"{s.errors} errors | {s.retries} retries | {s.rejected} rejected | "
+                        f"avg {round(s.average_latency * 1000)}ms | last {round(s.last_latency * 1000)}ms"
+                        for host, s in sorted(self.bot.web.stats.items())
+                    ]
+                )
+                or "No upstream requests made yet.",
+                color=self.bot.info_color,
+            )
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def trackcache(self, ctx: AsahiContext):
+        """Show how often track lookups were answered without going to Lavalink"""
+        cache = self.bot.track_cache
+        stored = await self.bot.db.fetch_all(
+            "SELECT source, COUNT(*) AS entries FROM Track_Cache WHERE expires_at > :now GROUP BY source",
+            {"now": time.time()},
+        )
+        await ctx.send(
+            embed=discord.Embed(
+                title="Track Cache",
+                description=(
+                    f"Hit rate: **{cache.hit_rate:.1%}**\n"
+                    f"Memory hits: **{cache.memory_hits}** | Database hits: **{cache.db_hits}** | "
+                    f"Lavalink lookups: **{cache.misses}**\n"
+                    f"In memory: **{len(cache.memory)}** entries\n"
+                    f"Stored: {' | '.join(f'{row[0]} **{row[1]}**' for row in stored) or 'nothing'}"
+                ),
+                color=self.bot.info_color,
+            )
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def playback(self, ctx: AsahiContext):
+        """Show the gap between tracks, overall and for the guilds with the longest ones"""
+        stats = self.bot.playback_stats
+        worst = sorted(stats.guild_gaps.items(), key=lambda item: item[1].quantile(0.95), reverse=True)[:10]
         await ctx.send(
             embed=discord.Embed(
-                title=f"Total Observed WebSocket Events : {self.socket_stats.total()}",
-                description="\n".join([f"`{n}`: **{i}**" for n, i in self.socket_stats.most_common()]),
+                title="Playback Gaps",
+                description=(
+                    f"Transitions: **{stats.gaps.count}** | p50 {stats.gaps.quantile(0.5) * 1000:.0f}ms | "
+                    f"p95 {stats.gaps.quantile(0.95) * 1000:.0f}ms | p99 {stats.gaps.quantile(0.99) * 1000:.0f}ms\n"
+                    f"Next track resolved ahead: **{stats.prefetched}** | late: **{stats.resolved_late}**\n\n"
+                    + "\n".join(
+                        f"`{self.bot.get_guild(guild_id) or guild_id}`: {h.count} | "
+                        f"p50 {h.quantile(0.5) * 1000:.0f}ms | p95 {h.quantile(0.95) * 1000:.0f}ms"
+                        for guild_id, h in worst
+                    )
+                ),
+                color=self.bot.info_color,
+            )
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def nodes(self, ctx: AsahiContext):
+        """Show load, ping and health for each Lavalink node"""
+        lavalink = self.bot.lavalink
+        nodes = sorted(lavalink.nodes.items())
+        pings = await asyncio.gather(*(lavalink.ping(node) for _, node in nodes))
+        lines = []
+        for (name, node), ping in zip(nodes, pings):
+            stats = node.stats
+            lines.append(
+                f"`{name}` [{'up' if node.healthy else 'down'}]: **{node.player_count}** players "
+                f"({sum(p.is_playing for p in node.players.values())} playing) | "
+                f"cpu {f'{stats.cpu_system_load:.0%}' if stats else '?'} | "
+                f"frame deficit {node.frames_deficit} / nulled {node.frames_nulled} | "
+                f"penalty {lavalink.penalty(node):.1f} | ping {f'{ping * 1000:.0f}ms' if ping is not None else '-'} | "
+                f"{node.failures} failures"
+            )
+        await ctx.send(
+            embed=discord.Embed(
+                title="Lavalink Nodes",
+                description="\n".join(lines) or "No nodes connected.",
+                color=self.bot.info_color,
+            ).set_footer(text=f"{lavalink.migrations} players migrated")
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def dbstats(self, ctx: AsahiContext):
+        """Show the database write queue, group commit latency and query latency per operation"""
+        db = self.bot.db
+        await ctx.send(
+            embed=discord.Embed(
+                title="Database Stats",
+                description=(
+                    f"Write queue: **{db.depth}** pending | max {db.max_depth}\n"
+                    f"Commits: **{db.commits}** | avg {db.average_batch:.1f} writes per commit | "
+                    f"p50 {db.commit_latency.quantile(0.5) * 1000:.1f}ms | "
+                    f"p99 {db.commit_latency.quantile(0.99) * 1000:.1f}ms\n\n"
+                    + "\n".join(
+                        f"`{op}`: **{h.count}** | p50 {h.quantile(0.5) * 1000:.1f}ms | "
+                        f"p99 {h.quantile(0.99) * 1000:.1f}ms"
+                        for op, h in db.timings.items()
+                    )
+                ),
+                color=self.bot.info_color,
+            )
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def latency(self, ctx: AsahiContext, query: str = "total"):
+        """Show p50/p95/p99 latency per command, sorted by `total`, `calls`, `p50`, `p95` or `p99`.
+        Pass a command name instead to break its latency down by phase"""
+        profiles = self.bot.command_profiles
+        if (command := self.bot.get_command(query)) and command.qualified_name in profiles:
+            profile = profiles[command.qualified_name]
+            rows = [("total", profile.total), *profile.phases.items(), ("discord http", profile.http)]
+            return await ctx.send(
+                embed=discord.Embed(
+                    title=f"Latency of {command.qualified_name} | {profile.total.count} calls",
+                    description="```\n"
+                    + "\n".join(
+                        f"{name:<13}p50 {h.quantile(0.5) * 1000:>8.1f}ms  p95 {h.quantile(0.95) * 1000:>8.1f}ms  "
+                        f"p99 {h.quantile(0.99) * 1000:>8.1f}ms"
+                        for name, h in rows
+                    )
+                    + "\n```",
+                    color=self.bot.info_color,
+                )
+            )
+
+        keys = {
+            "total": lambda p: p.total_time,
+            "calls": lambda p: p.total.count,
+            "p50": lambda p: p.total.quantile(0.5),
+            "p95": lambda p: p.total.quantile(0.95),
+            "p99": lambda p: p.total.quantile(0.99),
+        }
+        if query not in keys:
+            return await ctx.send_error(f"Sort by one of {', '.join(f'`{k}`' for k in keys)} or pass a timed command.")
+        ranked = sorted(profiles.items(), key=lambda item: keys[query](item[1]), reverse=True)[:25]
+        await ctx.send(
+            embed=discord.Embed(
+                title=f"Command Latency | sorted by {query}",
+                description="\n".join(
+                    f"`{name}`: **{p.total.count}** calls | {p.total_time:.1f}s total | "
+                    f"p50 {p.total.quantile(0.5) * 1000:.0f}ms | p95 {p.total.quantile(0.95) * 1000:.0f}ms | "
+                    f"p99 {p.total.quantile(0.99) * 1000:.0f}ms"
+                    for name, p in ranked
+                )
+                or "No commands have been timed yet.",
+                color=self.bot.info_color,
+            )
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def cachestats(self, ctx: AsahiContext):
+        """Show the active cache profile, guild chunk states and the memory of the guilds caching the most members"""
+        bot, chunker = self.bot, self.bot.chunker
+        # Only the largest guilds are measured, walking every cached member would hold up the event loop
+        largest = {g.id: g for g in heapq.nlargest(10, bot.guilds, key=lambda g: len(g._members))}
+        messages: dict[int, list[discord.Message]] = {}
+        for message in bot.cached_messages:
+            if message.guild and message.guild.id in largest:
+                messages.setdefault(message.guild.id, []).append(message)
+        sizes = sorted(
+            ((guild_memory(g, messages.get(g.id, ())), g) for g in largest.values()), key=lambda x: x[0], reverse=True
+        )
+        states = Counter(chunker.state(g) for g in bot.guilds)
+        rss = psutil.Process().memory_info().rss
+        profile = bot.cache_profile
+        await ctx.send(
+            embed=discord.Embed(
+                title=f"Cache Profile: {profile.name}",
+                description=(
+                    f"Members intent: **{bot.intents.members}** | Presences intent: **{bot.intents.presences}** | "
+                    f"Message cache: **{profile.max_messages or 0}**\n"
+                    f"Guilds: {' | '.join(f'{state} **{count}**' for state, count in states.items()) or 'none'}\n"
+                    f"Lazy chunks: **{chunker.chunks}** | avg "
+                    f"{round(chunker.chunk_time / chunker.chunks * 1000) if chunker.chunks else 0}ms\n"
+                    f"RSS: **{humanize.naturalsize(rss)}** | "
+                    f"per guild **{humanize.naturalsize(rss / len(bot.guilds)) if bot.guilds else 0}**\n\n"
+                    + "\n".join(
+                        f"`{g}` [{chunker.state(g)}]: ~{humanize.naturalsize(size)} | {len(g.members)} cached members"
+                        for size, g in sizes[:10]
+                    )
+                ),
                 color=self.bot.info_color,
             )
         )
@@ -7,7 +7,7 @@ import discord
 import psutil
 
 from core import Asahi, AsahiContext, PrefixHandler
-from exts import humanize_timedelta, Paginator
+from exts import ButtonPaginator, humanize_timedelta
 
 
 class Meta(
@@ -18,6 +18,8 @@ class Meta(
     def __init__(self, bot: Asahi):
         self.bot = bot
         self.prefix_handler = PrefixHandler(self.bot)
+        self.process = psutil.Process(os.getpid())
+        self.process.cpu_percent()  # Baseline for the non blocking samples in `about`
 
     @commands.command()
     async def ping(self, ctx: AsahiContext):
@@ -36,9 +38,9 @@ class Meta(
     async def prefix(self, ctx: AsahiContext, *, prefix: str = None):
         """Set a guilds custom prefix. If none provided the set one will be provided"""
         if not prefix:
-            return await ctx.send_info(f"This guild's prefix is `{self.bot.get_custom_prefix(ctx.guild.id)}`")
+            return await ctx.send_info(f"This guild's prefix is `{await self.bot.get_custom_prefix(ctx.guild.id)}`")
         if ctx.author.guild_permissions.manage_guild:
-            self.prefix_handler.add_prefix(prefix[:10], ctx.guild.id)
+            await self.prefix_handler.add_prefix(prefix[:10], ctx.guild.id)
             await ctx.send_ok("Prefix set!")
         else:
             await ctx.send_error("You are lacking the required permission to run this command: `Manage Server`")
@@ -46,13 +48,14 @@ class Meta(
     @commands.command()
     async def credits(self, ctx: AsahiContext):
         """Yes..."""
+        owners = await self.bot.user_resolver.resolve_many(self.bot.owner_ids)
         await ctx.send(
             embed=discord.Embed(
                 title="Credits",
                 description=(
                     "Author: [Yat-o](https://github.com/Yat-o)\n"
                     "Contributors: A Full list can be found [here](https://github.com/Yat-o/Asahi/graphs/contributors)\n"
-                    f"Registered Bot Owners: {', '.join([str(await self.bot.fetch_user(o)) for o in self.bot.owner_ids])}\n"
+                    f"Registered Bot Owners: {', '.join([str(o) for o in owners.values() if o])}\n"
                     "Source Code: Can be found [here](https://github.com/Yat-o/Asahi/) "
                 ),
             ).set_thumbnail(url=self.bot.user.avatar.url)
@@ -68,52 +71,74 @@ class Meta(
     @commands.command()
     async def about(self, ctx: AsahiContext):
         """Information about the bot"""
-        pid = os.getpid()
-        memory_usage = round(psutil.Process(pid).memory_info().rss / 1024**2)
-        total_memory = round(psutil.virtual_memory().total / 1024**2)
-        cpu_usage = psutil.Process(pid).cpu_percent(interval=2)
-
-        embed = (
-            discord.Embed(
-                title="About Me", description=f"{self.bot.user} | {self.bot.user.id}", color=self.bot.info_color
-            )
-            .add_field(name="Creation Date", value=discord.utils.format_dt(self.bot.user.created_at, "F"))
-            .add_field(
-                name="Registered Owner(s)",
-                value=", ".join([f"`{await self.bot.getch_user(u)}`" for u in self.bot.owner_ids]),
-            )
-            .add_field(
-                name="Uptime",
-                value=humanize_timedelta(datetime.now() - self.bot.startup_time, precise=True),
-                inline=False,
+        clusters = None
+
+        async def global_stats() -> list[dict]:
+            nonlocal clusters
+            if clusters is None:  # Shared by the pages, asked for once
+                clusters = await self.bot.global_stats()
+            return clusters
+
+        async def about_page() -> discord.Embed:
+            owners = await self.bot.user_resolver.resolve_many(self.bot.owner_ids)
+            stats = await global_stats()
+            latency = sum(c["latency"] for c in stats) / len(stats)
+            return (
+                discord.Embed(
+                    title="About Me", description=f"{self.bot.user} | {self.bot.user.id}", color=self.bot.info_color
+                )
+                .add_field(name="Creation Date", value=discord.utils.format_dt(self.bot.user.created_at, "F"))
+                .add_field(
+                    name="Registered Owner(s)",
+                    value=", ".join([f"`{u}`" for u in owners.values() if u]),
+                )
+                .add_field(
+                    name="Uptime",
+                    value=humanize_timedelta(datetime.now() - self.bot.startup_time, precise=True),
+                    inline=False,
+                )
+                .add_field(name="Discord WebSocket Latency", value=f"{round(latency * 1000)}ms")
+                .add_field(
+                    name="Library & Language",
+                    value=f"Python: {platform.python_version()} | Discord.py: {discord.__version__}",
+                    inline=False,
+                )
+                .set_thumbnail(url=self.bot.user.avatar.url)
+                .set_footer(text=f"Asahi Version {self.bot.__version__}")
             )
-            .add_field(name="Discord WebSocket Latency", value=f"{round(self.bot.latency * 1000)}ms")
-            .add_field(
-                name="Library & Language",
-                value=f"Python: {platform.python_version()} | Discord.py: {discord.__version__}",
-                inline=False,
+
+        async def statistics_page() -> discord.Embed:
+            stats = await global_stats()
+            return (
+                discord.Embed(title="Statistics", color=self.bot.info_color)
+                .add_field(name="Guild Count", value=sum(c["guilds"] for c in stats))
+                .add_field(name="User Count", value=sum(c["users"] for c in stats))
+                .add_field(name="Shards", value=f"{sum(len(c['shards']) for c in stats)} in {len(stats)} cluster(s)")
+                .add_field(
+                    name="Command Usage",
+                    value=(
+                        f"Total Commands: {len(self.bot.commands)} | "
+                        f"Used Since Startup: {sum(c['commands'] for c in stats)}"
+                    ),
+                    inline=False,
+                )
             )
-            .set_thumbnail(url=self.bot.user.avatar.url)
-            .set_footer(text=f"Asahi Version {self.bot.__version__}")
-        )
 
-        embed2 = (
-            discord.Embed(title="Statistics", color=self.bot.info_color)
-            .add_field(name="Guild Count", value=len(self.bot.guilds))
-            .add_field(name="User Count", value=len(self.bot.users))
-            .add_field(
-                name="Command Usage",
-                value=f"Total Commands: {len(self.bot.commands)} | Used Since Startup: {self.bot.commands_ran}",
-                inline=False,
+        async def process_page() -> discord.Embed:
+            memory_usage = round(self.process.memory_info().rss / 1024**2)
+            total_memory = round(psutil.virtual_memory().total / 1024**2)
+            cpu_usage = self.process.cpu_percent()  # Since the previous sample, without blocking the page
+            return (
+                discord.Embed(title="Process Information", color=self.bot.info_color)
+                .add_field(name="CPU Usage", value=f"{cpu_usage}%")
+                .add_field(name="Memory Usage", value=f"{memory_usage}Mb of {total_memory}Mb")
+                .add_field(
+                    name="Memory Usage (All Clusters)",
+                    value=f"{round(sum(c['memory'] for c in await global_stats()) / 1024**2)}Mb",
+                )
             )
-        )
 
-        embed3 = (
-            discord.Embed(title="Process Information", color=self.bot.info_color)
-            .add_field(name="CPU Usage", value=f"{cpu_usage}%")
-            .add_field(name="Memory Usage", value=f"{memory_usage}Mb of {total_memory}Mb")
-        )
-        await Paginator([embed, embed2, embed3]).start(ctx)
+        await ButtonPaginator([about_page, statistics_page, process_page]).start(ctx)
 
 
 async def setup(bot: Asahi):
@@ -1,9 +1,58 @@
-from typing import Union
+from typing import Optional, Union
+import math
 
 from discord.ext import commands
 import discord
 
-from core import Asahi, AsahiContext, MuteHandler, WarningHandler
+from core import Asahi, AsahiContext, MuteHandler, needs_members, WarningHandler
+from exts import Paginator
+
+
+class WarnPaginator(Paginator):
+    """Pages through a member's warnings with keyset pagination, fetching and rendering each page on first view"""
+
+    per_page = 5
+
+    def __init__(self, ctx: AsahiContext, handler: WarningHandler, member: discord.Member, count: int):
+        super().__init__()
+        self.ctx = ctx
+        self.handler = handler
+        self.member = member
+        self.count = count
+        self._pages: dict[int, discord.Embed] = {}
+        self._cursors: list[int] = [0]  # Last warn ID before each page, known for every page fetched so far
+        self._last_page: Optional[int] = None  # Set once a short page shows the count went stale
+
+    @property
+    def page_count(self) -> int:
+        if self._last_page is not None:
+            return self._last_page + 1
+        return max(math.ceil(self.count / self.per_page), 1)
+
+    async def get_page(self, index: int) -> discord.Embed:
+        if index in self._pages:
+            return self._pages[index]
+        rows = await self.handler.fetch_warning_page(
+            self.member.id, self.ctx.guild.id, after=self._cursors[index], limit=self.per_page
+        )  # returns in (user, gid, mid, reason, wid)
+        if rows and len(self._cursors) == index + 1:
+            self._cursors.append(rows[-1][4])
+        if len(rows) < self.per_page and (self._last_page is None or index < self._last_page):
+            # Warnings were deleted since counting, so stop paging here instead of past the known cursors
+            self._last_page = index
+            self.count = min(self.count, index * self.per_page + len(rows))
+        moderators = await self.ctx.bot.user_resolver.resolve_many(row[2] for row in rows)
+        start = index * self.per_page
+        self._pages[index] = embed = discord.Embed(
+            title=f"Warnings for {self.member} | {self.count} total",
+            description="\n\n".join(
+                f"{num}. Warned for `{str(row[3])[:300]}` by `{moderators[row[2]]}` under warn ID: `{row[4]}`"
+                for num, row in enumerate(rows, start + 1)
+            )
+            or "No more warnings.",
+            color=self.ctx.bot.info_color,
+        ).set_footer(text=f"Page {index + 1}/{self.page_count}")
+        return embed
 
 
 class Moderation(commands.Cog):
@@ -36,6 +85,7 @@ class Moderation(commands.Cog):
     @commands.has_permissions(kick_members=True)
     @commands.bot_has_permissions(kick_members=True)
     @commands.guild_only()
+    @needs_members()
     async def kick(self, ctx: AsahiContext, member: discord.Member, *, reason: str = None):
         """Kick a member from this guild"""
         if await self.check_hierachy(ctx, member):
@@ -50,6 +100,7 @@ class Moderation(commands.Cog):
     @commands.has_permissions(ban_members=True)
     @commands.bot_has_permissions(ban_members=True)
     @commands.guild_only()
+    @needs_members()
     async def ban(self, ctx: AsahiContext, member: Union[discord.Member, int], *, reason: str = None):
         """Bans a member from this guild"""
         reason = reason or "No Reason Provided"
@@ -71,17 +122,17 @@ class Moderation(commands.Cog):
     @commands.has_permissions(kick_members=True)
     @commands.bot_has_permissions(manage_roles=True)
     @commands.guild_only()
+    @needs_members()
     async def mute(self, ctx: AsahiContext, member: discord.Member, *, reason: str = None):
         """Mute a member in this guild"""
         if await self.check_hierachy(ctx, member):
             return
 
         reason = reason or "No Reason Provided"
-        raw_role_data = await self.mute_handler.fetch_mute_role(ctx.guild.id)
+        role = ctx.guild.get_role(await self.mute_handler.fetch_mute_role(ctx.guild.id) or 0)
 
-        if not raw_role_data:
+        if not role:
             return await ctx.send_error("No mute role configured for this guild. Try again after setting one.")
-        role = ctx.guild.get_role(raw_role_data[0])
         if role.position > ctx.me.top_role.position:
             return await ctx.send_error(
                 "The mute role cannot be above me highest role. Please re-configure it to be lower and try again."
@@ -94,14 +145,14 @@ class Moderation(commands.Cog):
     @commands.has_permissions(kick_members=True)
     @commands.bot_has_permissions(manage_roles=True)
     @commands.guild_only()
+    @needs_members()
     async def unmute(self, ctx: AsahiContext, member: discord.Member):
         """Unmmute a member in this guild"""
 
-        raw_role_data = await self.mute_handler.fetch_mute_role(ctx.guild.id)
+        role = ctx.guild.get_role(await self.mute_handler.fetch_mute_role(ctx.guild.id) or 0)
 
-        if not raw_role_data:
+        if not role:
             return await ctx.send_error("No mute role configured for this guild. Try again after setting one.")
-        role = ctx.guild.get_role(raw_role_data[0])
 
         if role not in member.roles:
             return await ctx.send_error("This member is currently not muted with the configured mute role")
@@ -117,6 +168,7 @@ class Moderation(commands.Cog):
     @commands.dynamic_cooldown(owner_cooldown_bypass, type=commands.BucketType.user)
     @commands.has_permissions(kick_members=True)
     @commands.guild_only()
+    @needs_members()
     async def warn(self, ctx: AsahiContext, member: discord.Member, *, reason: str = None):
         """Warn a member in this guild"""
         if await self.check_hierachy(ctx, member):
@@ -132,21 +184,13 @@ class Moderation(commands.Cog):
     @commands.dynamic_cooldown(owner_cooldown_bypass, type=commands.BucketType.user)
     @commands.has_permissions(kick_members=True)
     @commands.guild_only()
+    @needs_members()
     async def warns(self, ctx: AsahiContext, member: discord.Member = None):
         """View all the warns for someone in this guild"""
         member = member or ctx.author
-
-        raw_warn_data: list[tuple] = await self.warn_handler.fetch_warnings(
-            member.id, ctx.guild.id
-        )  # returns in (user, gid, mid, reason, wid)
-        await ctx.send_info(
-            "\n\n".join(
-                [
-                    f"{num}. Warned for `{i[3]}` by `{await self.bot.getch_user(i[2])}` under warn ID: `{i[4]}`"
-                    for num, i in enumerate(raw_warn_data, 1)
-                ]
-            )
-        )
+        if not (count := await self.warn_handler.count_warnings(member.id, ctx.guild.id)):
+            return await ctx.send_info(f"{member} has no warnings in this guild")
+        await WarnPaginator(ctx, self.warn_handler, member, count).start(ctx)
 
     @commands.command()
     @commands.cooldown(1, 60, commands.BucketType.user)
@@ -1,29 +1,345 @@
 from datetime import timedelta
-from typing import Optional, Union
+from typing import Any, Optional, Union
 import asyncio
+import functools
+import heapq
+import json
 import logging
+import time
 
 from discord.ext import commands
 from discord.ui import Select, View
-from pomice import LoopMode, Playlist, Queue, Track
+from pomice import LoopMode, Playlist, SearchType, Track
 import discord
+import humanize
 import pomice
 
 from core import Asahi, AsahiContext
-from exts import chunk_list, humanize_timedelta, Paginator
+from exts import ButtonPaginator, humanize_timedelta, PageSource, QueuedTrack, TrackQueue
+
+LOGGER = logging.getLogger("music-master")
 
 
 class Player(pomice.Player):
-    """Custom implementation of pomice's player adding a queue system"""
+    """Custom implementation of pomice's player adding a queue system
+
+    Queued tracks that still need a Lavalink search (Spotify ones not `resolved` yet) are resolved a few tracks ahead of
+    playback, sharing `resolve_limit` across players, so `play` doesn't have to search for them on the spot.
+    The player moves on to the next track itself as soon as Lavalink reports the end of the current one.
+    New players go to the least loaded node and can be moved to another one without losing their place.
+    """
+
+    resolve_limit = asyncio.Semaphore(4)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._queue: Queue = Queue()
+    def __init__(self, client: Asahi = None, channel: discord.VoiceChannel = None, *, node: pomice.Node = None):
+        super().__init__(client, channel, node=node or client.lavalink.best_node())
+        self._queue: TrackQueue = TrackQueue()
+        self.lookahead: int = self.client.config.get("music_resolve_ahead", 3)
+        self._resolving: dict[int, asyncio.Task] = {}
+        self._ended_at: Optional[float] = None
+        self.voice_ready = asyncio.Event()
 
     @property
-    def queue(self) -> Queue:
+    def queue(self) -> TrackQueue:
         return self._queue
 
+    async def on_voice_server_update(self, data: dict) -> None:
+        await super().on_voice_server_update(data)
+        if {"sessionId", "event"} <= self._voice_state.keys():
+            self.voice_ready.set()
+
+    async def _dispatch_event(self, data: dict) -> None:
+        if data.get("type") == "TrackStartEvent" and self._ended_at is not None:
+            self.client.playback_stats.observe(self.guild.id, time.perf_counter() - self._ended_at)
+            self._ended_at = None
+        await super()._dispatch_event(data)
+        if data.get("type") == "TrackEndEvent" and data.get("reason") not in ("REPLACED", "CLEANUP"):
+            self._ended_at = time.perf_counter()
+            asyncio.create_task(self.advance())
+
+    async def advance(self) -> None:
+        """Start the next track after the current one ended, telling listeners when the queue ran out"""
+        stats = self.client.playback_stats
+        if upcoming := self.queue.upcoming(1):
+            if upcoming[0].resolved:
+                stats.prefetched += 1
+            else:
+                stats.resolved_late += 1
+        if not await self.play_next():
+            self._ended_at = None
+            self.client.dispatch("pomice_queue_end", self)
+
+    async def move_to(self, node: pomice.Node) -> None:
+        """Carry on on another node: hand it the voice session, then resume the track where it was"""
+        position = self.position if self._current and self._current.original else 0
+        self._node._players.pop(self.guild.id, None)
+        self._node = node
+        node._players[self.guild.id] = self
+        if {"sessionId", "event"} <= self._voice_state.keys():
+            await self._dispatch_voice_update(self._voice_state)
+        if self._current:
+            await pomice.Player.play(self, self._current, start=int(position))
+        if self._volume != 100:
+            await self.set_volume(self._volume)
+        if self._filters._filters:
+            await node.send(op="filters", guildId=str(self.guild.id), **self._filters.get_all_payloads())
+        if self._paused:
+            await self.set_pause(True)
+        LOGGER.info(f"Moved the player for {self.guild} to node {node._identifier}")
+
+    def snapshot(self) -> Optional[dict[str, Any]]:
+        """What `restore` needs to carry on from here, None when there's nothing to carry on with"""
+        if self.channel is None or (self._current is None and not self.queue):
+            return None
+        current = self._current
+        return {
+            "channel": self.channel.id,
+            "current": QueuedTrack.from_track(current).dump() if current else None,
+            "position": int(self.position) if current and current.is_seekable else 0,
+            "paused": self._paused,
+            "volume": self._volume,
+            "loop": self.queue.loop_mode.value if self.queue.loop_mode else None,
+            "cursor": self.queue._cursor,
+            "queue": [track.dump() for track in self.queue],
+        }
+
+    async def restore(self, state: dict[str, Any]) -> None:
+        """Rebuild the queue from a snapshot and resume the track it was playing at the saved position"""
+        current = QueuedTrack.load(state["current"]) if state["current"] else None
+        self.queue.load(
+            [QueuedTrack.load(data) for data in state["queue"]],
+            loop_mode=LoopMode(state["loop"]) if state["loop"] else None,
+            cursor=state["cursor"],
+            current=current,
+        )
+        if state["volume"] != 100:
+            await self.set_volume(state["volume"])
+        if current:
+            await self.play(current, start=state["position"])
+        elif not await self.play_next():
+            return
+        if state["paused"]:
+            await self.set_pause(True)
+
+    async def get_tracks(
+        self, query: str, *, ctx: Optional[commands.Context] = None, search_type: SearchType = SearchType.ytsearch
+    ) -> Union[Playlist, list[Track], None]:
+        return await self.client.track_cache.get_tracks(self._node, query, ctx=ctx, search_type=search_type)
+
+    def resolve_ahead(self) -> None:
+        """Start resolving the next few placeholder tracks in the background"""
+        for track in self.queue.upcoming(self.lookahead):
+            if not track.resolved and id(track) not in self._resolving:
+                self._resolving[id(track)] = asyncio.create_task(self._resolve(track))
+
+    async def _resolve(self, track: QueuedTrack) -> None:
+        try:
+            async with self.resolve_limit:
+                if track.resolved:
+                    return
+                queries = [f"{track.search_type}:{track.title} - {track.author}"]
+                if track.isrc:
+                    queries.insert(0, f"{track.search_type}:{track.isrc}")
+                for query in queries:  # The same order pomice searches in when playing
+                    if results := await self.get_tracks(query):
+                        track.resolve(results.tracks[0] if isinstance(results, Playlist) else results[0])
+                        return
+        except Exception as exc:
+            LOGGER.debug(f"Couldn't resolve {track.title} ahead of time: {exc!r}")
+        finally:
+            self._resolving.pop(id(track), None)
+
+    async def play(self, track: Union[Track, QueuedTrack], **kwargs) -> Track:
+        if isinstance(track, QueuedTrack):
+            if task := self._resolving.get(id(track)):
+                await asyncio.shield(task)  # Already being searched for, don't search twice
+            track = track.to_track(self.guild)
+        track = await super().play(track, **kwargs)
+        self.resolve_ahead()
+        return track
+
+    async def play_next(self) -> Optional[Track]:
+        """Play the next track in the queue, skipping the ones Lavalink can't find. None once it's empty"""
+        for _ in range(len(self.queue) + 1):  # Bounded for loop modes, which hand out the same tracks again
+            try:
+                return await self.play(self.queue.get())
+            except pomice.QueueEmpty:
+                return None
+            except pomice.TrackLoadError as e:
+                LOGGER.warning(f"Skipping unplayable track in {self.guild}: {e}")
+        return None
+
+
+class IdleReaper:
+    """Destroys players that stayed idle past their deadline, from one heap of deadlines and a single timer
+
+    A player is idle when it has nothing left to play or nobody but bots in its channel. Deadlines are set by the
+    events that make a player idle and are checked again when they come up, so a player that got busy since is
+    left alone.
+    """
+
+    def __init__(self, bot: Asahi, *, timeout: float = 60, batch: int = 25):
+        self.bot = bot
+        self.timeout = timeout
+        self.batch = batch
+        self.deadlines: dict[int, float] = {}
+        self._heap: list[tuple[float, int]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @staticmethod
+    def is_idle(player: Player) -> bool:
+        if not player.is_playing and not player.queue:
+            return True
+        return player.channel is not None and not any(not m.bot for m in player.channel.members)
+
+    def schedule(self, guild_id: int) -> None:
+        loop = asyncio.get_running_loop()
+        self.deadlines[guild_id] = deadline = loop.time() + self.timeout
+        heapq.heappush(self._heap, (deadline, guild_id))
+        if self._timer is None:
+            self._timer = loop.call_at(deadline, self._fire)
+
+    def cancel(self, guild_id: int) -> None:
+        self.deadlines.pop(guild_id, None)  # Its heap entry is skipped when it comes up
+
+    def close(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+
+    def _fire(self) -> None:
+        loop = asyncio.get_running_loop()
+        due = []
+        while self._heap and self._heap[0][0] <= loop.time():
+            deadline, guild_id = heapq.heappop(self._heap)
+            if self.deadlines.get(guild_id) == deadline:
+                del self.deadlines[guild_id]
+                due.append(guild_id)
+        if len(self._heap) > 2 * len(self.deadlines) + 64:  # Drop entries of cancelled and pushed back deadlines
+            self._heap = [(deadline, guild_id) for guild_id, deadline in self.deadlines.items()]
+            heapq.heapify(self._heap)
+        self._timer = loop.call_at(self._heap[0][0], self._fire) if self._heap else None
+        if due:
+            asyncio.create_task(self._reap(due))
+
+    async def _reap(self, guild_ids: list[int]) -> None:
+        players = [
+            player
+            for guild_id in guild_ids
+            if (guild := self.bot.get_guild(guild_id))
+            and isinstance(player := guild.voice_client, Player)
+            and self.is_idle(player)
+        ]
+        for i in range(0, len(players), self.batch):
+            results = await asyncio.gather(*(p.destroy() for p in players[i : i + self.batch]), return_exceptions=True)
+            self.bot.playback_stats.reclaimed += sum(not isinstance(r, Exception) for r in results)
+        if players:
+            LOGGER.info(f"Reclaimed {len(players)} idle players")
+
+
+class PlayerSnapshots:
+    """Keeps the state of every player in the Player_Snapshots table so a restart can resume them
+
+    Snapshots are taken every `interval` seconds and once more on shutdown. On startup the players saved within
+    `max_age` seconds are reconnected, `concurrency` at a time, and resume at their saved position from the
+    encoded tracks, without searching for anything again.
+    """
+
+    def __init__(self, bot: Asahi, *, interval: float = 30, max_age: float = 600, concurrency: int = 10):
+        self.bot = bot
+        self.interval = interval
+        self.max_age = max_age
+        self.restored = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self._loaded = False  # Nothing is saved before the last snapshots were restored, that would drop them
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        await self.restore()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception as exc:
+                LOGGER.warning(f"Couldn't save player snapshots: {exc!r}")
+
+    async def save(self) -> int:
+        """Snapshot every player of this cluster, returns how many were saved"""
+        if not self._loaded:
+            return 0
+        now = time.time()
+        rows = [
+            {
+                "guild_id": player.guild.id,
+                "cluster": self.bot.cluster_id,
+                "payload": json.dumps(state, separators=(",", ":")),
+                "saved_at": now,
+            }
+            for node in self.bot.lavalink.nodes.values()
+            for player in node.players.values()
+            if isinstance(player, Player) and (state := player.snapshot())
+        ]
+        if rows:
+            await self.bot.db.execute_many(
+                "INSERT OR REPLACE INTO Player_Snapshots (guild_id, cluster, payload, saved_at) "
+                "VALUES (:guild_id, :cluster, :payload, :saved_at)",
+                rows,
+            )
+        await self.bot.db.execute(  # Players that are gone since the last snapshot
+            "DELETE FROM Player_Snapshots WHERE cluster = :cluster AND saved_at < :now",
+            {"cluster": self.bot.cluster_id, "now": now},
+        )
+        return len(rows)
+
+    async def restore(self) -> int:
+        """Reconnect and resume the players saved before the last shutdown, returns how many were resumed"""
+        rows = await self.bot.db.fetch_all(
+            "SELECT guild_id, payload FROM Player_Snapshots WHERE saved_at >= :since",
+            {"since": time.time() - self.max_age},
+        )
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                self._restore(guild, json.loads(row["payload"]))
+                for row in rows
+                if (guild := self.bot.get_guild(row["guild_id"]))  # Other clusters resume their own
+            ),
+            return_exceptions=True,
+        )
+        self._loaded = True
+        self.restored += sum(result is True for result in results)
+        for result in results:
+            if isinstance(result, Exception):
+                LOGGER.warning(f"Couldn't resume a player: {result!r}")
+        if results:
+            LOGGER.info(
+                f"Resumed {sum(result is True for result in results)}/{len(results)} players "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        return sum(result is True for result in results)
+
+    async def _restore(self, guild: discord.Guild, state: dict[str, Any]) -> bool:
+        channel = guild.get_channel(state["channel"])
+        if guild.voice_client or not isinstance(channel, discord.VoiceChannel):
+            return False
+        if not channel.permissions_for(guild.me).connect:
+            return False
+        async with self._semaphore:
+            player: Player = await channel.connect(cls=Player)
+            try:
+                await asyncio.wait_for(player.voice_ready.wait(), 10)
+                await player.restore(state)
+            except BaseException:
+                await player.destroy()
+                raise
+        return True
+
 
 class TrackNavigator(Select):
     def __init__(self, ctx: AsahiContext, tracks: list[Track]):
@@ -66,6 +382,14 @@ class Music(
 ):
     def __init__(self, bot: Asahi):
         self.bot = bot
+        Player.resolve_limit = asyncio.Semaphore(self.bot.config.get("music_resolve_concurrency", 4))
+        self.reaper = IdleReaper(self.bot, timeout=self.bot.config.get("music_idle_timeout", 60))
+        self.snapshots = PlayerSnapshots(
+            self.bot,
+            interval=self.bot.config.get("music_snapshot_interval", 30),
+            max_age=self.bot.config.get("music_snapshot_max_age", 600),
+            concurrency=self.bot.config.get("music_restore_concurrency", 10),
+        )
         asyncio.get_event_loop().create_task(self.create_ll_connection())
 
     def is_vc_joinable(self, ctx: AsahiContext) -> bool:
@@ -80,46 +404,47 @@ class Music(
             return True
 
     async def create_ll_connection(self) -> None:
-        """Create a connection to LavaLink node"""
-        await self.bot.wait_until_ready()
-        music_logger = logging.getLogger("music-master")
-        try:
-            node = await self.bot.node_pool.create_node(
-                bot=self.bot,
-                host=self.bot.config.get("ll_host"),
-                port=self.bot.config.get("ll_port"),
-                password=self.bot.config.get("ll_password"),
-                spotify_client_id=self.bot.config.get("spotify_client_id"),
-                spotify_client_secret=self.bot.config.get("spotify_client_secret"),
-                identifier="MAIN",
-            )
-            music_logger.info(f"Sucessfully created Node: {node._identifier}")
-        except (pomice.NodeCreationError, pomice.NodeConnectionFailure) as e:
-            music_logger.error(f"Error while creating Node. Unloading cog now...\n{e}")
-            await self.cog_unload()
+        """Connect to the configured LavaLink nodes, then resume the players from before the last restart"""
+        await self.bot.lavalink.start()
+        self.snapshots.start()
+
+    async def cog_unload(self) -> None:
+        self.reaper.close()
+        self.snapshots.close()
 
     @commands.Cog.listener()
-    async def on_pomice_track_end(self, player: Player, track: pomice.Track, _):
-        try:
-            await player.play(player.queue.get())
-        except pomice.QueueEmpty:
-            await asyncio.sleep(60)
-            if not player.current and not player.queue:
-                await player.destroy()
+    async def on_pomice_queue_end(self, player: Player):
+        self.reaper.schedule(player.guild.id)
+
+    @commands.Cog.listener()
+    async def on_pomice_track_start(self, player: Player, track: pomice.Track):
+        if not self.reaper.is_idle(player):
+            self.reaper.cancel(player.guild.id)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(
+        self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState
+    ):
+        player = member.guild.voice_client
+        if not isinstance(player, Player) or player.channel not in (before.channel, after.channel):
+            return
+        if member.id == self.bot.user.id and after.channel is None:
+            return self.reaper.cancel(member.guild.id)
+        if self.reaper.is_idle(player):
+            if member.guild.id not in self.reaper.deadlines:
+                self.reaper.schedule(member.guild.id)
+        else:
+            self.reaper.cancel(member.guild.id)
 
     @commands.Cog.listener()
     async def on_pomice_track_stuck(self, player: Player, track, _):
-        try:
-            await player.play(player.queue.get())
-        except pomice.QueueEmpty:
-            await player.destroy()
+        if not await player.play_next():
+            self.reaper.schedule(player.guild.id)
 
     @commands.Cog.listener()
-    async def on_pomice_track_exception(self, player: Player, track, _):
-        try:
-            await player.play(player.queue.get())
-        except pomice.QueueEmpty:
-            await player.destroy()
+    async def on_pomice_track_exception(self, player: Player, track, exception):
+        # Lavalink follows this up with a LOAD_FAILED track end, the player moves on from there
+        LOGGER.warning(f"Track {track} failed in {player.guild}: {exception}")
 
     @commands.command(aliases=["join", "con"])
     async def connect(self, ctx: AsahiContext):
@@ -143,12 +468,13 @@ class Music(
             return await ctx.send_error(f"No tracks found with the query '{query}'")
 
         if isinstance(results, Playlist):
-            for track in results.tracks:
-                player.queue.put(track)
+            player.queue.extend(results.tracks)  # Spotify tracks stay placeholders until they're close to playing
             await ctx.send_ok(f"Added {results.track_count} tracks to the queue")
             if not player.is_playing:
-                await player.play(player.queue.get())
-                await ctx.send_ok(f"Now playing {player.current.title} from {player.current.author}")
+                if await player.play_next():
+                    await ctx.send_ok(f"Now playing {player.current.title} from {player.current.author}")
+            else:
+                player.resolve_ahead()
             return
 
         else:
@@ -156,6 +482,7 @@ class Music(
                 trk = results.pop(0)
                 if player.is_playing:
                     player.queue.put(trk)
+                    player.resolve_ahead()
                     await ctx.send_ok(f"Added {trk.title} from {trk.author} to the queue")
                     return
                 await player.play(trk)
@@ -179,19 +506,72 @@ class Music(
         if not player.queue:
             return await ctx.send_info("No tracks left in queue.")
 
-        queue_length: str = humanize_timedelta(timedelta(milliseconds=sum([int(i.length) for i in player.queue])))
-        track_list: list[list[Track]] = list(chunk_list(list(player.queue), 8))
-        embeds = [
-            discord.Embed(
-                description="\n".join([f"{trk.title[:50]} - {trk.author[:50]}" for trk in _list]),
-                color=self.bot.info_color,
+        queue_length: str = humanize_timedelta(timedelta(milliseconds=player.queue.duration))
+        footer = (
+            f"Vol: {player.volume}% | Track Count: {len(player.queue)} | Length: {queue_length} | "
+            f"Memory: ~{humanize.naturalsize(player.queue.memory_usage())}"
+        )
+        author = f"Current song {player.current.title[:50]} - {player.current.author[:25]}"
+
+        def page(start: int) -> discord.Embed:
+            return (
+                discord.Embed(
+                    description="\n".join(
+                        [
+                            f"{num}. {trk.title[:50]} - {trk.author[:50]}"
+                            for num, trk in enumerate(player.queue.slice(start, start + 8), start + 1)
+                        ]
+                    )
+                    or "No more tracks.",
+                    color=self.bot.info_color,
+                )
+                .set_footer(text=footer)
+                .set_author(name=author)
+                .set_thumbnail(url=ctx.guild.icon.url)
             )
-            .set_footer(text=f"Vol: {player.volume}% | Track Count: {len(player.queue)} | Length: {queue_length}")
-            .set_author(name=f"Current song {player.current.title[:50]} - {player.current.author[:25]}")
-            .set_thumbnail(url=ctx.guild.icon.url)
-            for _list in track_list
-        ]
-        await Paginator(embeds).start(ctx)
+
+        pages = [functools.partial(page, start) for start in range(0, len(player.queue), 8)]
+        await ButtonPaginator(PageSource(pages)).start(ctx)
+
+    @commands.command(aliases=["rm"])
+    async def remove(self, ctx: AsahiContext, position: int):
+        """Remove the track at a position in the queue"""
+        player: Player = ctx.voice_client
+        if not player:
+            return await ctx.send_error("There is no active player.")
+        if not 1 <= position <= len(player.queue):
+            return await ctx.send_error(f"Position must be between 1 and {len(player.queue)}")
+        track = player.queue.remove_at(position - 1)
+        await ctx.send_ok(f"Removed {track.title[:50]} from the queue")
+
+    @commands.command(aliases=["mv"])
+    async def move(self, ctx: AsahiContext, source: int, destination: int):
+        """Move a track in the queue to another position"""
+        player: Player = ctx.voice_client
+        if not player:
+            return await ctx.send_error("There is no active player.")
+        if not (1 <= source <= len(player.queue) and 1 <= destination <= len(player.queue)):
+            return await ctx.send_error(f"Positions must be between 1 and {len(player.queue)}")
+        track = player.queue.move(source - 1, destination - 1)
+        await ctx.send_ok(f"Moved {track.title[:50]} to position {destination}")
+
+    @commands.command()
+    async def shuffle(self, ctx: AsahiContext):
+        """Shuffle the queue"""
+        player: Player = ctx.voice_client
+        if not player:
+            return await ctx.send_error("There is no active player.")
+        player.queue.shuffle()
+        await ctx.send_ok(f"Shuffled {len(player.queue)} tracks")
+
+    @commands.command()
+    async def dedupe(self, ctx: AsahiContext):
+        """Remove tracks that are already queued earlier on"""
+        player: Player = ctx.voice_client
+        if not player:
+            return await ctx.send_error("There is no active player.")
+        removed = player.queue.dedupe()
+        await ctx.send_ok(f"Removed {removed} duplicate tracks")
 
     @commands.command(aliases=["np"])
     async def nowplaying(self, ctx: AsahiContext):
@@ -212,7 +592,10 @@ class Music(
                 name="Length",
                 value=humanize_timedelta(timedelta(milliseconds=player.current.length)),
             )
-            .add_field(name="Requester", value=player.current.requester)
+            .add_field(
+                name="Requester",
+                value=f"<@{player.current.requester.id}>" if player.current.requester else "Unknown",
+            )
             .set_thumbnail(url=player.current.thumbnail)
         )
 
@@ -4,7 +4,7 @@ from typing import Union
 from discord.ext import commands
 import discord
 
-from core import Asahi, AsahiContext
+from core import Asahi, AsahiContext, needs_members
 
 
 class Utility(
@@ -25,6 +25,7 @@ class Utility(
 
     @commands.command(aliases=["memberinfo", "uinfo", "minfo"])
     @commands.guild_only()
+    @needs_members()
     async def userinfo(self, ctx: AsahiContext, *, user: discord.Member = None):
         """Retrieve information about a user on discord"""
         user = user or ctx.author
@@ -46,12 +47,13 @@ class Utility(
         if flags:
             embed.add_field(name="Flags", value=", ".join([f"`{flag}`" for flag in flags]))
         if not user.bot:
-            if banner := (await self.bot.fetch_user(user.id)).banner:
+            if banner := await self.bot.user_resolver.banner(user.id):
                 embed.set_image(url=banner.url)
         await ctx.send(embed=embed)
 
     @commands.command(aliases=["sinfo", "guildinfo", "ginfo"])
     @commands.guild_only()
+    @needs_members()
     async def serverinfo(self, ctx: AsahiContext):
         """Retrieve information about this guild"""
         g = ctx.guild
@@ -139,6 +141,7 @@ class Utility(
 
     @commands.command(aliases=["av"])
     @commands.guild_only()
+    @needs_members()
     async def avatar(self, ctx: AsahiContext, *, member: discord.Member = None):
         """Show a user's avatar"""
         member = member or ctx.author
@@ -1,3 +1,12 @@
 from .bot import *
+from .cluster import *
 from .context import *
 from .database import *
+from .dispatch import *
+from .ipc import *
+from .migrations import *
+from .prefix import *
+from .profiles import *
+from .sqlite import *
+from .tracks import *
+from .users import *
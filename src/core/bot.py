@@ -1,24 +1,39 @@
+from collections import Counter
 from datetime import datetime
-from typing import Union
+from typing import Any, Optional, Union
 import io
 import logging
 import os
+import time
 import traceback
 
-from databases import Database
 from discord.ext import commands
 import aiohttp
 import discord
-import pomice
+import psutil
 
-from exts._logging import LoggingHandler
+from exts._logging import get_writer, LoggingHandler
+from exts.events import CommandEvent, EventSink
 from exts.helpers import color_resolver, Config
+from exts.http import UpstreamError, WebClient
+from exts.images import ImagePool
+from exts.lavalink import NodeManager
+from exts.metrics import CommandProfile, CURRENT_TIMER, InvocationTimer, MetricsServer, PlaybackStats
 
 from .context import AsahiContext
+from .database import SettingsStore
+from .dispatch import MessageDispatcher
+from .ipc import IPCClient
+from .migrations import MigrationRunner
+from .prefix import PrefixMatcher
+from .profiles import GuildChunker, resolve_profile
+from .sqlite import SQLiteDatabase
+from .tracks import TrackCache
+from .users import UserResolver
 
 
 class Asahi(commands.AutoShardedBot):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, cluster_id: int = 0, ipc_path: Optional[str] = None, **kwargs):
         for logger in [
             "asahi",
             "discord.client",
@@ -30,29 +45,119 @@ class Asahi(commands.AutoShardedBot):
         ]:
             logging.getLogger(logger).setLevel(logging.DEBUG if logger == "asahi" else logging.INFO)
             logging.getLogger(logger).addHandler(LoggingHandler())
+        self.config: Config = Config()
+        self.cache_profile = resolve_profile(
+            self.config.get("cache_profile", "full"), self.config.get("cache_profiles", {})
+        )
         super().__init__(
             command_prefix=self.get_prefix,
-            intents=discord.Intents.all(),
             activity=discord.Activity(type=discord.ActivityType.competing, name="Best Girl"),
             enable_debug_events=True,
+            http_trace=self.discord_http_trace(),
             *args,
+            **self.cache_profile.to_dict(),
             **kwargs,
         )
-        self.db: Database = Database("sqlite:///src/core/data/asahi.db")
-        self.config: Config = Config()
+        self.db = SQLiteDatabase(
+            "sqlite:///src/core/data/asahi.db",
+            readers=self.config.get("db_readers", 4),
+            commit_window=self.config.get("db_commit_window", 0.005),
+            cached_statements=self.config.get("db_cached_statements", 256),
+        )
+        self.chunker = GuildChunker(self)
         self.owner_ids: set[int] = set(self.config.get("owner_ids"))
-        self.prefixes: dict[int, str] = {}
+        self.settings = SettingsStore(self, maxsize=self.config.get("settings_cache_size", 10000))
+        self.prefix_matcher = PrefixMatcher(self, maxsize=self.config.get("settings_cache_size", 10000))
         self.ok_color: int = color_resolver(self.config.get("ok_color"))
         self.info_color: int = color_resolver(self.config.get("info_color"))
         self.error_color: int = color_resolver(self.config.get("error_color"))
         self.logger = logging.getLogger("asahi")
         self.startup_time: datetime = datetime.now()
-        self.node_pool = pomice.NodePool()
+        self.lavalink = NodeManager(self)
+        self.node_pool = self.lavalink.pool
+        self.web = WebClient(
+            timeout=self.config.get("http_timeout", 10),
+            retries=self.config.get("http_retries", 2),
+            limit_per_host=self.config.get("http_limit_per_host", 10),
+        )
+        self.user_resolver = UserResolver(self)
+        self.track_cache = TrackCache(
+            self, maxsize=self.config.get("track_cache_size", 5000), ttls=self.config.get("track_cache_ttl", {})
+        )
+        self.image_pool = ImagePool(
+            self,
+            size=self.config.get("image_pool_size", 10),
+            low_water=self.config.get("image_pool_low_water", 3),
+            ttl=self.config.get("image_pool_ttl", 900),
+        )
         self.commands_ran = 0
+        self.command_events = EventSink(self.logger, sampling=self.config.get("command_log_sampling", {}))
+        self.socket_stats: Counter[str] = Counter()
+        self.command_profiles: dict[str, CommandProfile] = {}
+        self.playback_stats = PlaybackStats()
+        self.before_invoke(self.enter_body)
+        self.dispatcher = MessageDispatcher(self)
+        self.add_listener(self.dispatcher.on_raw_reaction_add)
+        self.add_listener(self.dispatcher.on_interaction)
+        self.log_writer = get_writer()
+        self.cluster_id = cluster_id
+        self.metrics_process = psutil.Process()
+        self.ipc = IPCClient(cluster_id, ipc_path)
+        self.ipc.handler("stats")(self.cluster_stats)
+        self.metrics_server = (
+            MetricsServer(
+                self,
+                host=self.config.get("metrics_host", "127.0.0.1"),
+                port=self.config.get("metrics_port", 8080) + cluster_id,
+            )
+            if self.config.get("metrics_enabled", False)
+            else None
+        )
         self.__version__ = "3.2.7"
 
     async def on_message(self, msg: discord.Message) -> None:
-        await self.invoke(await self.get_context(msg, cls=AsahiContext))
+        start = time.perf_counter()
+        if not await self.prefix_matcher.match(msg):  # Most messages aren't commands, skip building a context
+            return
+        timer = InvocationTimer("prefix", since=start)
+        timer.enter("context")
+        CURRENT_TIMER.set(timer)  # Scoped to this message's event task
+        ctx = await self.get_context(msg, cls=AsahiContext)
+        timer.enter("checks")
+        await self.invoke(ctx)
+
+    @staticmethod
+    def discord_http_trace() -> aiohttp.TraceConfig:
+        """Adds the time requests to Discord's API take to the running invocation's timer"""
+
+        async def on_request_start(_, context, __) -> None:
+            context.start = time.perf_counter()
+
+        async def on_request_end(_, context, __) -> None:
+            if timer := CURRENT_TIMER.get():  # The hooks run in the task that sent the request
+                timer.http += time.perf_counter() - context.start
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_end)
+        return trace
+
+    async def enter_body(self, ctx: AsahiContext) -> None:
+        """Global before invoke hook, runs once converters and the other before hooks are done"""
+        ctx.timer.enter("body")
+
+    async def add_cog(self, cog: commands.Cog, /, **kwargs) -> None:
+        await super().add_cog(cog, **kwargs)
+        self.dispatcher.add_cog(cog)
+
+    async def remove_cog(self, name: str, /, **kwargs) -> Optional[commands.Cog]:
+        if cog := await super().remove_cog(name, **kwargs):
+            self.dispatcher.remove_cog(cog)
+        return cog
+
+    async def on_socket_event_type(self, event: str) -> None:
+        self.socket_stats[event] += 1
 
     async def on_connect(self) -> None:
         self.logger.info("Finished establishing gateway connection(s).")
@@ -60,35 +165,58 @@ class Asahi(commands.AutoShardedBot):
     async def on_ready(self) -> None:
         self.logger.info(f"{self.user} is now ready.")
 
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        self.settings.evict(guild.id)
+        self.chunker.forget(guild.id)
+        self.playback_stats.forget(guild.id)
+
     async def on_command_completion(self, ctx: AsahiContext) -> None:
         self.commands_ran += 1
-        location = f"DM Channel | {ctx.author.id}"
-        if ctx.guild:
-            location = f"Guild {ctx.guild} | {ctx.guild.id}"
-        self.logger.info(
-            "----------\n"
-            "Command Executed\n"
-            f"Name: {ctx.command.qualified_name}\n"
-            f"User: {ctx.author}\n"
-            f"Location: {location}"
-            f"Usage: {ctx.message.content}"
+        self.record_command(ctx)
+
+    def record_command(self, ctx: AsahiContext, outcome: str = "ok") -> None:
+        """Push a structured event for a finished invocation into the command event sink and its profile"""
+        ctx.timer.finish()
+        if (profile := self.command_profiles.get(ctx.command.qualified_name)) is None:
+            profile = self.command_profiles[ctx.command.qualified_name] = CommandProfile()
+        profile.observe(ctx.timer)
+        self.command_events.push(
+            CommandEvent(
+                ctx.command.qualified_name,
+                guild_id=ctx.guild.id if ctx.guild else None,
+                shard_id=ctx.guild.shard_id if ctx.guild else None,
+                user_id=ctx.author.id,
+                latency=ctx.timer.total,
+                outcome=outcome,
+            )
         )
 
     async def close(self) -> None:
         self.logger.info("Recieved signal to terminate bot process.")
+        self.image_pool.close()
+        await self.ipc.close()
+        if self.metrics_server:
+            await self.metrics_server.stop()
         if self.session:
-            await self.session.close()
+            await self.web.close()
             self.logger.info("Destroyed HTTP session")
+        mlog = logging.getLogger("music-master")
+        if music := self.get_cog("Music"):  # Before the players go, so the next start resumes them
+            music.snapshots.close()
+            try:
+                mlog.info(f"Saved snapshots of {await music.snapshots.save()} players")
+            except Exception as exc:
+                mlog.error(f"Couldn't save player snapshots: {exc!r}")
+
         dlog = logging.getLogger("database")
-        if self.db.connection:
+        if self.db.is_connected:
             await self.db.disconnect()
         dlog.info("Terminated all connections to database within the connection pool.")
 
-        mlog = logging.getLogger("music-master")
         for node in self.node_pool.nodes.values():
             for player in list(node.players.values()):
                 await player.disconnect(force=True)
-                await mlog.info(f"Disconnected Player for {player.channel.guild}")
+                mlog.info(f"Disconnected Player for {player.guild}")
         mlog.info("Finished cleaning up Music/LavaLink. Closing now...")
         await super().close()
 
@@ -97,6 +225,7 @@ class Asahi(commands.AutoShardedBot):
 
         if isinstance(error, commands.CommandNotFound):
             return
+        self.record_command(ctx, type(error).__name__)
 
         if isinstance(
             error,
@@ -114,6 +243,11 @@ class Asahi(commands.AutoShardedBot):
         ):
             await ctx.send_error(str(error))
 
+        if isinstance(error, commands.CommandInvokeError) and isinstance(error.original, UpstreamError):
+            return await ctx.send_error(
+                "The service this command relies on is not responding right now. Please try again later."
+            )
+
         if isinstance(error, commands.CommandInvokeError):
             await ctx.send_error(
                 "There was an internal problem with this command. "
@@ -125,7 +259,10 @@ class Asahi(commands.AutoShardedBot):
             self.logger.error(formatted_tb)
             for owner in self.owner_ids:
                 try:
-                    await self.get_user(owner).send(
+                    if (user := await self.user_resolver.resolve(owner)) is None:
+                        self.logger.warning(f"Couldn't resolve owner {owner} to dm them the error.")
+                        continue
+                    await user.send(
                         f"There was an internal error thrown for command {ctx.command.qualified_name}\n"
                         "Info:\n"
                         f"`User`: **{ctx.author}** | `Guild`: **{ctx.guild}** | `Usage`: **{ctx.message.content}**",
@@ -134,8 +271,8 @@ class Asahi(commands.AutoShardedBot):
                             f"{ctx.message.created_at.strftime('%m/%d/%Y %H:%M')}.nim",
                         ),
                     )
-                except Exception:
-                    self.logger.warning(f"Failed to dm {owner}.")
+                except Exception as exc:
+                    self.logger.warning(f"Failed to dm {owner}: {exc!r}")
         else:
             self.logger.error(formatted_tb)
 
@@ -143,42 +280,61 @@ class Asahi(commands.AutoShardedBot):
         """Startup entry"""
         self.logger.info("Starting Asahi now.")
         self.logger.info(f"Time: {self.startup_time.strftime('%m/%d/%Y %H:%M')}")
+        self.logger.info(f"Using cache profile: {self.cache_profile.name}")
         await self.db_entry()
-        for ext in os.listdir("src/cogs"):  # Cog loading process
-            if ext.endswith(".py"):
-                try:
-                    await self.load_extension(f"cogs.{ext[:-3]}")
-                    self.logger.info(f"Loaded extension: {ext}")
-                except commands.ExtensionError as exp:
-                    self.logger.error(f"Failed to load {ext} : {exp}")
         async with self:
-            async with aiohttp.ClientSession() as session:
-                self.session: aiohttp.ClientSession = session
+            async with self.web:
+                self.session: aiohttp.ClientSession = self.web.session  # Set before cogs load so they can prefetch
+                await self.web.warmup(*self.image_pool.urls())
+                if self.metrics_server:
+                    await self.metrics_server.start()
+                self.ipc.start()
+                for ext in os.listdir("src/cogs"):  # Cog loading process
+                    if ext.endswith(".py"):
+                        try:
+                            await self.load_extension(f"cogs.{ext[:-3]}")
+                            self.logger.info(f"Loaded extension: {ext}")
+                        except commands.ExtensionError as exp:
+                            self.logger.error(f"Failed to load {ext} : {exp}")
                 await self.start(self.config.get("token"))
 
-    async def db_entry(self) -> None:
-        logger = logging.getLogger("database")
-        with open("./src/core/data/schema.sql") as f:  # Setup Database
-            for line in f.read().split(";;"):
-                await self.db.execute(line)
-        logger.info("Finished Building Database")
+    async def cluster_stats(self) -> dict[str, Any]:
+        """This process' share of the global stats, answered over IPC"""
+        return {
+            "cluster": self.cluster_id,
+            "shards": sorted(self.shards),
+            "guilds": len(self.guilds),
+            "users": sum(g.member_count or 0 for g in self.guilds),
+            "latency": self.latency,
+            "commands": self.commands_ran,
+            "events": dict(self.socket_stats),
+            "memory": self.metrics_process.memory_info().rss,
+        }
+
+    async def global_stats(self) -> list[dict[str, Any]]:
+        """Stats of every cluster, or just this one when running as a single process"""
+        return sorted(await self.ipc.collect("stats"), key=lambda s: s["cluster"])
 
-        for guild, prefix in await self.db.fetch_all("SELECT guild_id, prefix FROM Guild_Settings"):
-            self.prefixes.setdefault(guild, prefix)
-        logger.info("Finished appending prefixes to on-board memory cache")
+    async def db_entry(self) -> None:
+        await self.db.connect()
+        await MigrationRunner(self.db).run()
+        await self.track_cache.prune()
 
     async def get_prefix(self, msg: discord.Message) -> Union[list[str], str]:
-        if not msg.guild or msg.guild.id not in self.prefixes:
-            return commands.when_mentioned_or(self.config.get("prefix"))(self, msg)
-        else:
-            return commands.when_mentioned_or(self.prefixes[msg.guild.id])(self, msg)
+        timer = CURRENT_TIMER.get()
+        if timing := timer is not None and timer.phase == "context":  # Only while building the context
+            timer.enter("prefix")
+        try:
+            return list(await self.prefix_matcher.prefixes(msg.guild.id if msg.guild else None))
+        finally:
+            if timing:
+                timer.enter("context")
 
-    def get_custom_prefix(self, guild: int) -> str:
+    async def get_custom_prefix(self, guild: int) -> str:
         """Get a guild's custom prefix. If one is not found the default prefix is returned"""
-        return self.prefixes.get(guild) or self.config.get("prefix")
+        return await self.settings.prefix(guild)
 
     async def getch_user(self, userid: int) -> discord.User:
-        try:
-            return self.get_user(userid) or await self.fetch_user(userid)
-        except discord.NotFound:
+        if not (user := await self.user_resolver.resolve(userid)):
             self.logger.error(f"No user could be found with ID: {userid}")
+        return user
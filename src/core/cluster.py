@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from typing import Optional
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+import aiohttp
+
+from exts._logging import LoggingHandler
+from exts.helpers import Config
+
+from .ipc import IPCHub
+
+LOGGER = logging.getLogger("asahi")
+
+
+def run_cluster(cluster_id: int, shard_ids: list[int], shard_count: int, ipc_path: str) -> None:
+    """Worker process entry point"""
+    from .bot import Asahi
+
+    async def main() -> None:
+        bot = Asahi(shard_ids=shard_ids, shard_count=shard_count, cluster_id=cluster_id, ipc_path=ipc_path)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):  # Shut down cleanly when the launcher stops
+            loop.add_signal_handler(sig, lambda: asyncio.create_task(bot.close()))
+        await bot.startup()
+
+    asyncio.run(main())
+
+
+class Cluster:
+    """One worker process owning a contiguous range of shards"""
+
+    def __init__(self, cluster_id: int, shard_ids: list[int]):
+        self.id = cluster_id
+        self.shard_ids = shard_ids
+        self.process: Optional[multiprocessing.Process] = None
+        self.restarts = 0
+        self.started_at = 0.0
+
+    def __str__(self) -> str:
+        return f"Cluster {self.id} (shards {self.shard_ids[0]}-{self.shard_ids[-1]})"
+
+
+class Launcher:
+    """Spawns the clusters, restarts the ones that die and runs the IPC hub they report through"""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.cluster_count: int = config.get("cluster_count", 1)
+        self.ipc_path: str = config.get("ipc_socket", "/tmp/asahi-ipc.sock")
+        self.hub = IPCHub(self.ipc_path)
+        self.clusters: list[Cluster] = []
+        self.shard_count = 0
+        self._context = multiprocessing.get_context("spawn")  # Never fork the log writer thread
+        self._stopping = asyncio.Event()
+        logging.getLogger("asahi").setLevel(logging.DEBUG)
+        logging.getLogger("asahi").addHandler(LoggingHandler())
+
+    def run(self) -> None:
+        asyncio.run(self.start())
+
+    async def start(self) -> None:
+        self.shard_count = self.config.get("shard_count", 0) or await self.recommended_shards()
+        per_cluster = -(-self.shard_count // self.cluster_count)  # Ceiling division
+        self.clusters = [
+            Cluster(i, list(range(start, min(start + per_cluster, self.shard_count))))
+            for i, start in enumerate(range(0, self.shard_count, per_cluster))
+        ]
+        LOGGER.info(f"cluster;Launching {len(self.clusters)} clusters for {self.shard_count} shards")
+
+        if os.path.exists(self.ipc_path):
+            os.unlink(self.ipc_path)
+        await self.hub.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        for cluster in self.clusters:
+            self.spawn(cluster)
+            await asyncio.sleep(5 * len(cluster.shard_ids))  # Stay within the identify rate limit
+        await self.supervise()
+
+    async def recommended_shards(self) -> int:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                "https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {self.config.get('token')}"}
+            ) as resp:
+                resp.raise_for_status()
+                return (await resp.json())["shards"]
+
+    def spawn(self, cluster: Cluster) -> None:
+        cluster.process = self._context.Process(
+            target=run_cluster,
+            args=(cluster.id, cluster.shard_ids, self.shard_count, self.ipc_path),
+            name=f"asahi-cluster-{cluster.id}",
+        )
+        cluster.process.start()
+        cluster.started_at = time.monotonic()
+        LOGGER.info(f"cluster;Started {cluster} as pid {cluster.process.pid}")
+
+    async def supervise(self) -> None:
+        """Restart clusters that exit, backing off for ones that crash right after starting"""
+        while not self._stopping.is_set():
+            for cluster in self.clusters:
+                if cluster.process and not cluster.process.is_alive():
+                    LOGGER.warning(f"cluster;{cluster} exited with code {cluster.process.exitcode}")
+                    if time.monotonic() - cluster.started_at < 60:  # Crash looping
+                        cluster.restarts += 1
+                    else:
+                        cluster.restarts = 0
+                    cluster.process = None
+                    asyncio.get_running_loop().call_later(
+                        min(2**cluster.restarts, 300), lambda c=cluster: self._stopping.is_set() or self.spawn(c)
+                    )
+            try:
+                await asyncio.wait_for(self._stopping.wait(), 5)
+            except asyncio.TimeoutError:
+                pass
+        await self.shutdown()
+
+    async def shutdown(self) -> None:
+        LOGGER.info("cluster;Stopping all clusters")
+        for cluster in self.clusters:
+            if cluster.process and cluster.process.is_alive():
+                cluster.process.terminate()  # SIGTERM, the bot closes its connections on it
+        for cluster in self.clusters:
+            if cluster.process:
+                await asyncio.to_thread(cluster.process.join, 30)
+                if cluster.process.is_alive():
+                    cluster.process.kill()
+        await self.hub.close()
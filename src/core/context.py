@@ -1,19 +1,36 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import Any, Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from .bot import Asahi
 
-import asyncio
-
 from discord.ext import commands
 import discord
 
+from exts.metrics import CURRENT_TIMER, InvocationTimer
+
 
 class AsahiContext(commands.Context):
     bot: Asahi
 
+    def __init__(self, **attrs):
+        timer = CURRENT_TIMER.get()  # Set by on_message, contexts built elsewhere get their own timer
+        self.timer: InvocationTimer = timer if timer and timer.phase == "context" else InvocationTimer("context")
+        super().__init__(**attrs)
+
+    @property
+    def args(self) -> list[Any]:
+        return self._args
+
+    @args.setter
+    def args(self, value: list[Any]) -> None:
+        # discord.py has no hook between checks and converters. Command._parse_arguments assigns args right after
+        # checks and cooldowns, before running converters, which is why discord.py is pinned in requirements.txt
+        if self.timer.phase == "checks":
+            self.timer.enter("converters")
+        self._args = value
+
     async def send_ok(self, content: str) -> discord.Message:
         """Send OK embeds"""
         await self.send(
@@ -38,22 +55,30 @@ class AsahiContext(commands.Context):
             )
         )
 
+    async def send_image(
+        self, description: Optional[str] = None, *, color: Optional[discord.Colour] = None, footer: Optional[str] = None
+    ) -> discord.Message:
+        """Send an image for the invoked command from the bot's image pool"""
+        embed = discord.Embed(description=description, color=color or self.bot.ok_color)
+        embed.set_image(url=await self.bot.image_pool.get(self.command.name))
+        if footer:
+            embed.set_footer(text=footer)
+        return await self.send(embed=embed)
+
     async def trash(self, msg: discord.Message) -> None:
         """Adds a trash reaction to the messages; when clicked, the bot deletes the message"""
         await msg.add_reaction("🗑️")
 
-        def check(reaction: discord.Reaction, user: discord.User) -> bool:
-            return reaction.message.id == msg.id and user == self.author and not user.bot
-
-        try:
-            reaction, user = await self.bot.wait_for("reaction_add", check=check, timeout=60)
-
-            reaction: discord.Reaction
-            user: discord.User  # throwaway
+        async def on_reaction(payload: discord.RawReactionActionEvent) -> None:
+            if str(payload.emoji) != "🗑️":
+                return
+            self.bot.dispatcher.unregister(msg.id)
+            try:
+                await msg.delete()
+            except discord.NotFound:
+                pass
 
-            await reaction.message.delete()
-        except asyncio.TimeoutError:
-            pass
+        self.bot.dispatcher.register(msg, users={self.author.id}, on_reaction=on_reaction, timeout=60)
 
     async def trigger_typing(self):  # Add this back since Danny removed
         await self._state.http.send_typing((await self._get_channel()).id)
@@ -0,0 +1,3 @@
+CREATE INDEX IF NOT EXISTS Warn_Table_guild_user ON Warn_Table(guild_id, user, warn_id)
+;;
+CREATE INDEX IF NOT EXISTS Warn_Table_guild_warn ON Warn_Table(guild_id, warn_id)
@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS Track_Cache(
+    query TEXT NOT NULL PRIMARY KEY,
+    source VARCHAR(16) NOT NULL,
+    payload TEXT NOT NULL,
+    expires_at REAL NOT NULL
+)
+;;
+CREATE INDEX IF NOT EXISTS Track_Cache_expires ON Track_Cache(expires_at)
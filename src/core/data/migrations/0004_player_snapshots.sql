@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS Player_Snapshots(
+    guild_id BIGINT NOT NULL PRIMARY KEY,
+    cluster INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    saved_at REAL NOT NULL
+)
@@ -1,10 +1,92 @@
+from __future__ import annotations
+
+from typing import Optional, TYPE_CHECKING
+import asyncio
 import logging
 
-from .bot import Asahi
+if TYPE_CHECKING:
+    from .bot import Asahi
+
+from exts.cache import LRUCache
 
 LOGGER = logging.getLogger("database")
 
 
+class GuildSettings:
+    """A guild's stored settings, None meaning the default is used"""
+
+    __slots__ = ("prefix", "mute_role", "confession_channel")
+
+    def __init__(
+        self, prefix: Optional[str] = None, mute_role: Optional[int] = None, confession_channel: Optional[int] = None
+    ):
+        self.prefix = prefix
+        self.mute_role = mute_role
+        self.confession_channel = confession_channel
+
+    def replace(self, **fields) -> GuildSettings:
+        """Copy of these settings with the given fields changed"""
+        return GuildSettings(**{k: fields.get(k, getattr(self, k)) for k in self.__slots__})
+
+
+DEFAULT_SETTINGS = GuildSettings()  # Shared by every guild without stored settings, never mutate
+
+
+class SettingsStore:
+    """Lazily loaded, size bounded cache of guild settings
+
+    Guilds are loaded from the database on first use and kept in an LRU. Guilds without any stored settings
+    are cached too so they don't hit the database again. Handlers write through after updating the database.
+    """
+
+    def __init__(self, bot: Asahi, *, maxsize: int = 10000):
+        self.bot = bot
+        self.cache: LRUCache[int, GuildSettings] = LRUCache(maxsize)
+        self._loading: dict[int, asyncio.Task] = {}
+
+    async def get(self, guild: int) -> GuildSettings:
+        if settings := self.cache.get(guild):
+            return settings
+        if guild not in self._loading:  # Concurrent lookups for the same guild share one query
+            task = asyncio.create_task(self._load(guild))
+            self._loading[guild] = task
+            task.add_done_callback(lambda _: self._loading.pop(guild, None))
+        return await asyncio.shield(self._loading[guild])
+
+    async def prefix(self, guild: int) -> str:
+        """A guild's prefix, or the default prefix if it has none"""
+        return (await self.get(guild)).prefix or self.bot.config.get("prefix")
+
+    async def mute_role(self, guild: int) -> Optional[int]:
+        return (await self.get(guild)).mute_role
+
+    def update(self, guild: int, **fields) -> None:
+        """Write changed fields through to the cache. Uncached guilds are left to load lazily"""
+        if settings := self.cache.get(guild, record=False):
+            self.cache.set(guild, settings.replace(**fields))
+        if "prefix" in fields:
+            self.bot.prefix_matcher.invalidate(guild)
+
+    def evict(self, guild: int) -> None:
+        self.cache.pop(guild)
+        self.bot.prefix_matcher.invalidate(guild)
+
+    async def _load(self, guild: int) -> GuildSettings:
+        row = await self.bot.db.fetch_one(
+            "SELECT g.prefix, g.confession_channel, m.mute_role FROM (SELECT :guild AS guild_id) AS q "
+            "LEFT JOIN Guild_Settings g ON g.guild_id = q.guild_id "
+            "LEFT JOIN Mute_Settings m ON m.guild_id = q.guild_id",
+            values={"guild": guild},
+        )
+        prefix, confession_channel, mute_role = row if row else (None, None, None)
+        if prefix is None and confession_channel is None and mute_role is None:
+            settings = DEFAULT_SETTINGS
+        else:
+            settings = GuildSettings(prefix, mute_role, confession_channel)
+        self.cache.set(guild, settings)
+        return settings
+
+
 class PrefixHandler:
     def __init__(self, bot: Asahi):
         self.bot = bot
@@ -17,13 +99,15 @@ class PrefixHandler:
             "INSERT INTO Guild_Settings (guild_id, prefix) VALUES(:guild, :prefix) ON CONFLICT(guild_id) DO UPDATE SET prefix = :u_prefix",
             values={"guild": guild, "prefix": prefix, "u_prefix": prefix},
         )
-        self.bot.prefixes[guild] = prefix  # Add to cache
+        self.bot.settings.update(guild, prefix=prefix)  # Write through to cache
         LOGGER.info(f"Added custom prefix '{prefix}' for guild {guild}")
 
     async def remove_prefix(self, guild: int) -> None:
         """Remove a guild prefix from cache and db"""
-        await self.bot.db.execute("DELETE FROM Guild_Settings WHERE guild_id = :guild", values={"guild": guild})
-        del self.bot.prefixes[guild]  # Delete from cache
+        await self.bot.db.execute(
+            "UPDATE Guild_Settings SET prefix = NULL WHERE guild_id = :guild", values={"guild": guild}
+        )
+        self.bot.settings.update(guild, prefix=None)  # Write through to cache
         LOGGER.info(f"Removed custom prefix for guild {guild}")
 
 
@@ -36,13 +120,12 @@ class MuteHandler:
             "INSERT INTO Mute_Settings (guild_id, mute_role) VALUES(:guild, :mute_role) ON CONFLICT(guild_id) DO UPDATE SET mute_role = :u_mute_role",
             values={"guild": guild, "mute_role": role_id, "u_mute_role": role_id},
         )
+        self.bot.settings.update(guild, mute_role=role_id)  # Write through to cache
         LOGGER.info(f"Added mute role for guild {guild}")
 
-    async def fetch_mute_role(self, guild: int):
-        """Fetch a guilds mute role"""
-        return await self.bot.db.fetch_one(
-            "SELECT mute_role FROM Mute_Settings WHERE guild_id = :guild", values={"guild": guild}
-        )
+    async def fetch_mute_role(self, guild: int) -> Optional[int]:
+        """Fetch a guilds mute role ID"""
+        return await self.bot.settings.mute_role(guild)
 
 
 class WarningHandler:
@@ -57,6 +140,20 @@ class WarningHandler:
         )
         LOGGER.info(f"Added warn for user {member} for guild {guild_id} into Warn Table")
 
+    async def count_warnings(self, user: int, guild_id: int) -> int:
+        """Count a user's warnings in a guild, answered from the (guild_id, user) index alone"""
+        return await self.bot.db.fetch_val(
+            "SELECT COUNT(*) FROM Warn_Table WHERE guild_id = :gid AND user = :u", values={"u": user, "gid": guild_id}
+        )
+
+    async def fetch_warning_page(self, user: int, guild_id: int, *, after: int = 0, limit: int = 5):
+        """Fetch up to `limit` warnings with a warn ID above `after`, in (user, gid, mid, reason, wid) order"""
+        return await self.bot.db.fetch_all(
+            "SELECT user, guild_id, mod_id, reason, warn_id FROM Warn_Table "
+            "WHERE guild_id = :gid AND user = :u AND warn_id > :after ORDER BY warn_id LIMIT :limit",
+            values={"u": user, "gid": guild_id, "after": after, "limit": limit},
+        )
+
     async def fetch_warnings(self, user: int, guild_id: int):
         """Fetches warnings for a user under the specified guild"""
         return await self.bot.db.fetch_all(
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Optional, TYPE_CHECKING
+import asyncio
+import heapq
+import inspect
+import logging
+
+import discord
+
+if TYPE_CHECKING:
+    from discord.ext import commands
+
+    from .bot import Asahi
+
+LOGGER = logging.getLogger("asahi")
+
+ReactionHandler = Callable[[discord.RawReactionActionEvent], Awaitable[Any]]
+InteractionHandler = Callable[[discord.Interaction], Awaitable[Any]]
+ExpiryHandler = Callable[[], Any]
+
+
+def persistent_component(name: str) -> Callable:
+    """Mark a cog method as the handler for components with the custom ID `name` or `name:<args>`
+
+    The handler is called with the interaction and the custom ID's arguments. It's registered when the cog is
+    added and dropped when it's removed, so components sent before a reload keep working after it.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        func.__persistent_component__ = name
+        return func
+
+    return decorator
+
+
+class Listener:
+    """Handlers registered for a single message"""
+
+    __slots__ = ("message_id", "users", "on_reaction", "on_interaction", "on_expire", "timeout", "expires_at")
+
+    def __init__(
+        self,
+        message_id: int,
+        *,
+        users: Optional[set[int]],
+        on_reaction: Optional[ReactionHandler],
+        on_interaction: Optional[InteractionHandler],
+        on_expire: Optional[ExpiryHandler],
+        timeout: float,
+    ):
+        self.message_id = message_id
+        self.users = users
+        self.on_reaction = on_reaction
+        self.on_interaction = on_interaction
+        self.on_expire = on_expire
+        self.timeout = timeout
+        self.expires_at = 0.0
+
+
+class MessageDispatcher:
+    """Routes reaction and component events to the handler registered for their message
+
+    Replaces a `bot.wait_for` per open prompt, whose checks discord.py runs against every event, with a dict
+    lookup by message ID. Expiry deadlines live in one heap served by a single timer.
+    """
+
+    def __init__(self, bot: Asahi):
+        self.bot = bot
+        self.listeners: dict[int, Listener] = {}
+        self.persistent: dict[str, InteractionHandler] = {}
+        self.dispatched = 0
+        self.expired = 0
+        self._deadlines: list[tuple[float, int]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def register(
+        self,
+        message: discord.abc.Snowflake,
+        *,
+        users: Optional[set[int]] = None,
+        on_reaction: Optional[ReactionHandler] = None,
+        on_interaction: Optional[InteractionHandler] = None,
+        on_expire: Optional[ExpiryHandler] = None,
+        timeout: float = 60,
+    ) -> Listener:
+        """Route events for `message` from `users` (anyone if None) until `timeout` seconds pass without one"""
+        listener = Listener(
+            message.id,
+            users=users,
+            on_reaction=on_reaction,
+            on_interaction=on_interaction,
+            on_expire=on_expire,
+            timeout=timeout,
+        )
+        self.listeners[message.id] = listener
+        self.touch(listener)
+        return listener
+
+    def unregister(self, message_id: int) -> None:
+        self.listeners.pop(message_id, None)  # Its deadline is skipped when it comes up
+
+    def touch(self, listener: Listener) -> None:
+        """Push a listener's expiry back by its timeout"""
+        loop = asyncio.get_running_loop()
+        listener.expires_at = loop.time() + listener.timeout
+        heapq.heappush(self._deadlines, (listener.expires_at, listener.message_id))
+        if len(self._deadlines) > 4 * len(self.listeners) + 64:  # Mostly superseded deadlines, drop them
+            self._deadlines = [(l.expires_at, l.message_id) for l in self.listeners.values()]
+            heapq.heapify(self._deadlines)
+            return self._schedule(loop)
+        if self._deadlines[0][1] == listener.message_id and self._deadlines[0][0] == listener.expires_at:
+            self._schedule(loop)
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._timer:
+            self._timer.cancel()
+        self._timer = loop.call_at(self._deadlines[0][0], self._expire) if self._deadlines else None
+
+    def _expire(self) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            expires_at, message_id = heapq.heappop(self._deadlines)
+            listener = self.listeners.get(message_id)
+            if listener is None or listener.expires_at != expires_at:  # Gone or touched since
+                continue
+            del self.listeners[message_id]
+            self.expired += 1
+            if listener.on_expire:
+                self._run(listener.on_expire())
+        self._schedule(loop)
+
+    @staticmethod
+    def _run(result: Any) -> None:
+        if inspect.isawaitable(result):
+            asyncio.create_task(result)
+
+    def add_cog(self, cog: commands.Cog) -> None:
+        for _, method in inspect.getmembers(cog, inspect.ismethod):
+            if name := getattr(method, "__persistent_component__", None):
+                self.persistent[name] = method
+
+    def remove_cog(self, cog: commands.Cog) -> None:
+        self.persistent = {name: h for name, h in self.persistent.items() if getattr(h, "__self__", None) is not cog}
+
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent) -> None:
+        listener = self.listeners.get(payload.message_id)
+        if listener is None or listener.on_reaction is None or payload.user_id == self.bot.user.id:
+            return
+        if listener.users is not None and payload.user_id not in listener.users:
+            return
+        self.dispatched += 1
+        self.touch(listener)
+        await listener.on_reaction(payload)
+
+    async def on_interaction(self, interaction: discord.Interaction) -> None:
+        if interaction.type is not discord.InteractionType.component:
+            return
+        listener = self.listeners.get(interaction.message.id) if interaction.message else None
+        if listener and listener.on_interaction:
+            if listener.users is not None and interaction.user.id not in listener.users:
+                return await interaction.response.send_message("This isn't yours to use", ephemeral=True)
+            self.dispatched += 1
+            self.touch(listener)
+            return await listener.on_interaction(interaction)
+        name, _, args = interaction.data.get("custom_id", "").partition(":")
+        if handler := self.persistent.get(name):
+            self.dispatched += 1
+            try:
+                await handler(interaction, *(args.split(":") if args else ()))
+            except Exception as exc:
+                LOGGER.error(f"dispatch;Component handler {name} failed: {exc!r}")
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import itertools
+import json
+import logging
+
+LOGGER = logging.getLogger("asahi")
+
+STREAM_LIMIT = 16 * 1024**2  # Longest message, aggregated stats of many clusters outgrow asyncio's 64 KiB default
+
+
+async def _send(writer: asyncio.StreamWriter, payload: dict[str, Any]) -> None:
+    writer.write(json.dumps(payload, separators=(",", ":")).encode() + b"\n")
+    await writer.drain()
+
+
+class IPCHub:
+    """Unix socket hub run by the cluster launcher
+
+    Clusters connect and identify themselves. A `collect` from one cluster is fanned out to every connected
+    cluster and the answers are sent back to the asking cluster as one list.
+    Messages are newline delimited JSON objects with an `op` and a `nonce`.
+    """
+
+    def __init__(self, path: str, *, timeout: float = 5):
+        self.path = path
+        self.timeout = timeout
+        self.clusters: dict[int, asyncio.StreamWriter] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._nonces = itertools.count()
+        self._pending: dict[int, asyncio.Future] = {}
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_unix_server(self._handle, self.path, limit=STREAM_LIMIT)
+        LOGGER.info(f"ipc;Listening on {self.path}")
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def collect(self, op: str) -> list[Any]:
+        """Ask every connected cluster for `op` and gather the answers that arrive within the timeout"""
+        futures, nonces = [], []
+        for writer in list(self.clusters.values()):
+            nonce = next(self._nonces)
+            self._pending[nonce] = future = asyncio.get_running_loop().create_future()
+            futures.append(future)
+            nonces.append(nonce)
+            try:
+                await _send(writer, {"op": op, "nonce": nonce})
+            except (ConnectionError, RuntimeError):
+                future.cancel()
+        if futures:
+            await asyncio.wait(futures, timeout=self.timeout)
+        for nonce, future in zip(nonces, futures):
+            self._pending.pop(nonce, None)
+            future.cancel()  # No-op for answered ones
+        return [f.result() for f in futures if not f.cancelled()]
+
+    async def _answer(self, writer: asyncio.StreamWriter, op: str, nonce: int) -> None:
+        data = await self.collect(op)
+        try:
+            await _send(writer, {"op": "reply", "nonce": nonce, "data": data})
+        except (ConnectionError, RuntimeError):
+            pass
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        cluster = None
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["op"] == "identify":
+                    cluster = message["cluster"]
+                    self.clusters[cluster] = writer
+                    LOGGER.info(f"ipc;Cluster {cluster} connected")
+                elif message["op"] == "reply":
+                    if (future := self._pending.pop(message["nonce"], None)) and not future.done():
+                        future.set_result(message["data"])
+                elif message["op"] == "collect":  # In a task so this cluster's own reply can still be read
+                    asyncio.create_task(self._answer(writer, message["data"], message["nonce"]))
+        except Exception as exc:  # Malformed or oversized messages included, only this connection is dropped
+            LOGGER.warning(f"ipc;Dropping connection from cluster {cluster}: {exc!r}")
+        finally:
+            if cluster is not None and self.clusters.get(cluster) is writer:
+                del self.clusters[cluster]
+                LOGGER.info(f"ipc;Cluster {cluster} disconnected")
+            writer.close()
+
+
+class IPCClient:
+    """A cluster's connection to the launcher's hub
+
+    Handlers answer requests fanned out by the hub, `collect` asks every cluster at once. Without a hub
+    (the bot running as a single process) `collect` only answers locally.
+    """
+
+    def __init__(self, cluster: int, path: Optional[str], *, timeout: float = 10):
+        self.cluster = cluster
+        self.path = path
+        self.timeout = timeout
+        self.handlers: dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._nonces = itertools.count()
+        self._pending: dict[int, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None
+
+    def handler(self, op: str) -> Callable:
+        def decorator(func: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[Any]]:
+            self.handlers[op] = func
+            return func
+
+        return decorator
+
+    def start(self) -> None:
+        if self.path and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+        if self._writer:
+            self._writer.close()
+
+    async def collect(self, op: str) -> list[Any]:
+        """Answers from every cluster for `op` that replied in time"""
+        if not self.connected:
+            return [await self.handlers[op]()]
+        nonce = next(self._nonces)
+        self._pending[nonce] = future = asyncio.get_running_loop().create_future()
+        try:
+            await _send(self._writer, {"op": "collect", "nonce": nonce, "data": op})
+            return await asyncio.wait_for(future, self.timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            return [await self.handlers[op]()]  # Degrade to local numbers rather than failing the command
+        finally:
+            self._pending.pop(nonce, None)
+
+    async def _run(self) -> None:
+        """Keep a connection to the hub open, reconnecting with backoff"""
+        delay = 1
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path, limit=STREAM_LIMIT)
+                await _send(self._writer, {"op": "identify", "cluster": self.cluster})
+                delay = 1
+                while line := await reader.readline():
+                    asyncio.create_task(self._dispatch(json.loads(line)))
+            except Exception as exc:  # Anything but cancellation reconnects, IPC must not silently stop
+                LOGGER.warning(f"ipc;Connection to hub lost: {exc!r}, retrying in {delay}s")
+            if self._writer:
+                self._writer.close()
+            self._writer = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    async def _dispatch(self, message: dict[str, Any]) -> None:
+        try:
+            if message["op"] == "reply":
+                if (future := self._pending.get(message["nonce"])) and not future.done():
+                    future.set_result(message["data"])
+            elif (handler := self.handlers.get(message["op"])) and self._writer:
+                data = await handler()
+                await _send(self._writer, {"op": "reply", "nonce": message["nonce"], "data": data})
+        except Exception as exc:
+            LOGGER.error(f"ipc;Handling a message from the hub failed: {exc!r}")
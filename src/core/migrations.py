@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+import logging
+import os
+import re
+
+if TYPE_CHECKING:
+    from .sqlite import SQLiteDatabase
+
+LOGGER = logging.getLogger("database")
+
+MIGRATION_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+class Migration:
+    """A numbered SQL file, statements separated by `;;`"""
+
+    def __init__(self, version: int, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def statements(self) -> list[str]:
+        with open(self.path) as f:
+            return [s.strip() for s in f.read().split(";;") if s.strip()]
+
+
+class MigrationRunner:
+    """Applies migrations newer than the database's `PRAGMA user_version`
+
+    Each migration runs atomically together with the version bump, so an interrupted startup never leaves a
+    migration half applied.
+    """
+
+    def __init__(self, db: SQLiteDatabase, path: str = "./src/core/data/migrations"):
+        self.db = db
+        self.path = path
+
+    def migrations(self) -> list[Migration]:
+        found = []
+        for file in os.listdir(self.path):
+            if match := MIGRATION_RE.match(file):
+                found.append(Migration(int(match[1]), match[2], os.path.join(self.path, file)))
+        return sorted(found, key=lambda m: m.version)
+
+    async def version(self) -> int:
+        return await self.db.fetch_val("PRAGMA user_version")
+
+    async def run(self) -> int:
+        """Apply pending migrations and return the resulting schema version"""
+        current = await self.version()
+        pending = [m for m in self.migrations() if m.version > current]
+        if not pending:
+            LOGGER.info(f"Schema is up to date at version {current}")
+            return current
+        for migration in pending:
+            await self.db.execute_script([*migration.statements(), f"PRAGMA user_version = {migration.version}"])
+            LOGGER.info(f"Applied migration {migration.version:04d} {migration.name}")
+        return pending[-1].version
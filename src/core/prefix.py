@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .bot import Asahi
+
+import discord
+
+from exts.cache import LRUCache
+
+
+class PrefixMatcher:
+    """Per-guild prefix tuples, used to reject messages that can't be commands before a context is built
+
+    The tuples include the mention forms so `str.startswith` alone decides whether a message is a candidate.
+    Entries are dropped whenever a guild's prefix changes.
+    """
+
+    def __init__(self, bot: Asahi, *, maxsize: int = 10000):
+        self.bot = bot
+        self.cache: LRUCache[Optional[int], tuple[str, ...]] = LRUCache(maxsize)
+        self.rejected = 0
+        self.dispatched = 0
+
+    async def prefixes(self, guild: Optional[int]) -> tuple[str, ...]:
+        """Mention forms followed by the guild's prefix, or the default prefix outside guilds"""
+        if prefixes := self.cache.get(guild):
+            return prefixes
+        if self.bot.user is None:  # Mention forms aren't known before the first READY, don't cache without them
+            return (await self._prefix(guild),)
+        user_id = self.bot.user.id
+        prefixes = (f"<@{user_id}> ", f"<@!{user_id}> ", await self._prefix(guild))
+        self.cache.set(guild, prefixes)
+        return prefixes
+
+    async def match(self, msg: discord.Message) -> bool:
+        """Whether a message starts with one of its guild's prefixes, counted as dispatched or rejected"""
+        if msg.content and msg.content.startswith(await self.prefixes(msg.guild.id if msg.guild else None)):
+            self.dispatched += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def invalidate(self, guild: int) -> None:
+        self.cache.pop(guild)
+
+    @property
+    def reject_rate(self) -> float:
+        total = self.rejected + self.dispatched
+        return self.rejected / total if total else 0.0
+
+    async def _prefix(self, guild: Optional[int]) -> str:
+        return self.bot.config.get("prefix") if guild is None else await self.bot.settings.prefix(guild)
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, Optional, TYPE_CHECKING
+import asyncio
+import logging
+import sys
+import time
+
+if TYPE_CHECKING:
+    from .bot import Asahi
+    from .context import AsahiContext
+
+from discord.ext import commands
+import discord
+
+LOGGER = logging.getLogger("asahi")
+
+
+class CacheProfile:
+    """Intents and cache settings the bot connects with"""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        intents: discord.Intents,
+        member_cache_flags: discord.MemberCacheFlags,
+        max_messages: Optional[int],
+        chunk_guilds_at_startup: bool,
+    ):
+        self.name = name
+        self.intents = intents
+        self.member_cache_flags = member_cache_flags
+        self.max_messages = max_messages
+        self.chunk_guilds_at_startup = chunk_guilds_at_startup
+
+    @classmethod
+    def from_config(cls, name: str, data: dict[str, Any]) -> CacheProfile:
+        """Build a profile from a `[cache_profiles.<name>]` config table.
+
+        `intents` and `member_cache` are lists of flag names, or "all"/"default"/"none".
+        """
+        intents, flags = data.get("intents", "default"), data.get("member_cache", ["voice"])
+        if isinstance(intents, str):
+            if intents not in ("all", "default", "none"):
+                raise ValueError(f"Unknown intents '{intents}' in cache profile '{name}', expected all/default/none")
+            intents = getattr(discord.Intents, intents)()
+        else:
+            intents = discord.Intents(**dict.fromkeys(intents, True))
+        if isinstance(flags, str):
+            if flags == "default":  # What discord.py caches for these intents when no flags are given
+                flags = discord.MemberCacheFlags.from_intents(intents)
+            elif flags in ("all", "none"):
+                flags = getattr(discord.MemberCacheFlags, flags)()
+            else:
+                raise ValueError(f"Unknown member_cache '{flags}' in cache profile '{name}', expected all/default/none")
+        else:
+            flags = discord.MemberCacheFlags(**{f: f in flags for f in discord.MemberCacheFlags.VALID_FLAGS})
+        return cls(
+            name,
+            intents=intents,
+            member_cache_flags=flags,
+            max_messages=data.get("max_messages", 1000) or None,
+            chunk_guilds_at_startup=data.get("chunk_guilds_at_startup", False),
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "intents": self.intents,
+            "member_cache_flags": self.member_cache_flags,
+            "max_messages": self.max_messages,
+            "chunk_guilds_at_startup": self.chunk_guilds_at_startup,
+        }
+
+
+def _intents(**disabled: bool) -> discord.Intents:
+    intents = discord.Intents.all()
+    for name, value in disabled.items():
+        setattr(intents, name, value)
+    return intents
+
+
+PROFILES: dict[str, CacheProfile] = {
+    # Everything cached up front, what the bot always did
+    "full": CacheProfile(
+        "full",
+        intents=discord.Intents.all(),
+        member_cache_flags=discord.MemberCacheFlags.all(),
+        max_messages=1000,
+        chunk_guilds_at_startup=True,
+    ),
+    # No presences, members are only cached for guilds that used a command needing them
+    "balanced": CacheProfile(
+        "balanced",
+        intents=_intents(presences=False),
+        member_cache_flags=discord.MemberCacheFlags(voice=True, joined=True),
+        max_messages=1000,
+        chunk_guilds_at_startup=False,
+    ),
+    # Members only as far as voice and messages bring them in, converters fall back to fetching
+    "minimal": CacheProfile(
+        "minimal",
+        intents=_intents(presences=False, members=False, typing=False, integrations=False, webhooks=False),
+        member_cache_flags=discord.MemberCacheFlags(voice=True, joined=False),
+        max_messages=None,
+        chunk_guilds_at_startup=False,
+    ),
+}
+
+
+def resolve_profile(name: str, custom: Optional[dict[str, dict]] = None) -> CacheProfile:
+    """Look up a profile by name, custom profiles from config take precedence over the built in ones"""
+    if custom and name in custom:
+        return CacheProfile.from_config(name, custom[name])
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown cache profile '{name}', expected one of: {', '.join(PROFILES)}") from None
+
+
+class GuildChunker:
+    """Chunks guilds the first time a command needs their member list
+
+    Concurrent requests for the same guild share one chunk request.
+    """
+
+    def __init__(self, bot: Asahi):
+        self.bot = bot
+        self.chunked_at: dict[int, float] = {}  # guild -> time.time() of the lazy chunk
+        self.chunks = 0
+        self.chunk_time = 0.0
+        self._inflight: dict[int, asyncio.Task] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.bot.intents.members
+
+    def state(self, guild: discord.Guild) -> str:
+        if guild.chunked:
+            return "chunked"
+        return "chunking" if guild.id in self._inflight else "lazy"
+
+    async def ensure(self, guild: discord.Guild) -> None:
+        """Chunk a guild unless its members are already cached. Without the members intent this does nothing"""
+        if guild.chunked or not self.enabled:
+            return
+        if guild.id not in self._inflight:
+            task = asyncio.create_task(self._chunk(guild))
+            self._inflight[guild.id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(guild.id, None))
+        await asyncio.shield(self._inflight[guild.id])
+
+    def forget(self, guild: int) -> None:
+        self.chunked_at.pop(guild, None)
+
+    async def _chunk(self, guild: discord.Guild) -> None:
+        start = time.perf_counter()
+        await guild.chunk(cache=True)
+        elapsed = time.perf_counter() - start
+        self.chunks += 1
+        self.chunk_time += elapsed
+        self.chunked_at[guild.id] = time.time()
+        LOGGER.info(f"chunker;Chunked {guild} ({guild.member_count} members) in {elapsed * 1000:.0f}ms")
+
+
+def needs_members():
+    """Check that chunks the guild before converters look members up"""
+
+    async def predicate(ctx: AsahiContext) -> bool:
+        if ctx.guild:
+            await ctx.bot.chunker.ensure(ctx.guild)
+        return True
+
+    return commands.check(predicate)
+
+
+def _shallow_size(obj: object) -> int:
+    size = sys.getsizeof(obj)
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            size += sys.getsizeof(getattr(obj, slot, None))
+    return size
+
+
+def guild_memory(guild: discord.Guild, messages: Iterable[discord.Message] = ()) -> int:
+    """Rough estimate of the bytes a guild's cached state takes, objects and their slot values counted shallowly"""
+    size = _shallow_size(guild)
+    for collection in (guild.members, guild.channels, guild.roles, guild.emojis):
+        size += sys.getsizeof(collection) + sum(_shallow_size(obj) for obj in collection)
+    return size + sum(_shallow_size(m) for m in messages)
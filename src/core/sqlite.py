@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Sequence
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from exts.metrics import Histogram
+
+LOGGER = logging.getLogger("database")
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # Durable across application crashes, WAL keeps the database consistent
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",  # 16MB page cache per connection
+    "PRAGMA mmap_size = 134217728",
+)
+
+
+class _Write:
+    __slots__ = ("query", "values", "kind", "future")
+
+    def __init__(self, query: str, values: Any, kind: str, future: asyncio.Future):
+        self.query = query
+        self.values = values
+        self.kind = kind  # "one", "many" or "script"
+        self.future = future
+
+
+class SQLiteDatabase:
+    """SQLite in WAL mode with a pool of read connections and a single group committing writer
+
+    Reads run concurrently on their own connections. Writes are queued to one writer that runs everything
+    queued within `commit_window` seconds in a single transaction, each statement in its own savepoint so a
+    failing statement doesn't take the others down with it. A write resolves once its transaction committed.
+    Prepared statements are cached per connection by the sqlite3 module.
+
+    Keeps the call signatures of `databases.Database` the rest of the bot was written against.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        readers: int = 4,
+        commit_window: float = 0.005,
+        max_batch: int = 256,
+        cached_statements: int = 256,
+    ):
+        self.path = url.removeprefix("sqlite:///")
+        self.readers = readers
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self.cached_statements = cached_statements
+        self.is_connected = False
+        self.timings: dict[str, Histogram] = {
+            op: Histogram() for op in ("execute", "execute_many", "fetch_one", "fetch_all", "fetch_val")
+        }
+        self.commit_latency = Histogram()
+        self.commits = 0
+        self.batched_writes = 0
+        self.max_depth = 0
+        self._queue: asyncio.Queue[_Write] = asyncio.Queue()
+        self._local = threading.local()
+        self._read_executor: Optional[ThreadPoolExecutor] = None
+        self._write_executor: Optional[ThreadPoolExecutor] = None
+        self._write_connection: Optional[sqlite3.Connection] = None
+        self._read_connections: list[sqlite3.Connection] = []
+        self._writer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def depth(self) -> int:
+        """Writes waiting for the writer"""
+        return self._queue.qsize()
+
+    @property
+    def average_batch(self) -> float:
+        return self.batched_writes / self.commits if self.commits else 0.0
+
+    def _open(self, *, readonly: bool) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False, cached_statements=self.cached_statements
+        )
+        connection.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        if readonly:
+            connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    def _init_reader(self) -> None:
+        self._local.connection = connection = self._open(readonly=True)
+        self._read_connections.append(connection)
+
+    async def connect(self) -> None:
+        async with self._lock:
+            if self.is_connected:
+                return
+            loop = asyncio.get_running_loop()
+            self._write_executor = ThreadPoolExecutor(1, thread_name_prefix="asahi-db-writer")
+            self._write_connection = await loop.run_in_executor(
+                self._write_executor, lambda: self._open(readonly=False)
+            )  # Opened first so WAL mode is set before any reader connects
+            self._read_executor = ThreadPoolExecutor(
+                self.readers, thread_name_prefix="asahi-db-reader", initializer=self._init_reader
+            )
+            self._writer = asyncio.create_task(self._write_loop())
+            self.is_connected = True
+            LOGGER.info(f"Connected to {self.path} with {self.readers} readers")
+
+    async def disconnect(self) -> None:
+        if not self.is_connected:
+            return
+        self.is_connected = False
+        await self._queue.join()  # Let queued writes commit
+        self._writer.cancel()
+        self._read_executor.shutdown(wait=True)
+        for connection in self._read_connections:
+            connection.close()
+        self._read_connections.clear()
+        await asyncio.get_running_loop().run_in_executor(self._write_executor, self._write_connection.close)
+        self._write_executor.shutdown(wait=True)
+
+    async def _read(self, op: str, query: str, values: Optional[dict], fetch) -> Any:
+        if not self.is_connected:
+            await self.connect()
+        start = time.perf_counter()
+
+        def run() -> Any:
+            return fetch(self._local.connection.execute(query, values or {}))
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._read_executor, run)
+        finally:
+            self.timings[op].observe(time.perf_counter() - start)
+
+    async def fetch_one(self, query: str, values: Optional[dict] = None) -> Optional[sqlite3.Row]:
+        return await self._read("fetch_one", query, values, lambda cursor: cursor.fetchone())
+
+    async def fetch_all(self, query: str, values: Optional[dict] = None) -> list[sqlite3.Row]:
+        return await self._read("fetch_all", query, values, lambda cursor: cursor.fetchall())
+
+    async def fetch_val(self, query: str, values: Optional[dict] = None, column: Any = 0) -> Any:
+        row = await self._read("fetch_val", query, values, lambda cursor: cursor.fetchone())
+        return None if row is None else row[column]
+
+    async def _write(self, op: str, query: str, values: Any, kind: str) -> Any:
+        if not self.is_connected:
+            await self.connect()
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Write(query, values, kind, future))
+        if (depth := self._queue.qsize()) > self.max_depth:
+            self.max_depth = depth
+        try:
+            return await future
+        finally:
+            self.timings[op].observe(time.perf_counter() - start)
+
+    async def execute(self, query: str, values: Optional[dict] = None) -> Optional[int]:
+        """Run a write and return the last inserted row ID"""
+        return await self._write("execute", query, values or {}, "one")
+
+    async def execute_many(self, query: str, values: Sequence[dict]) -> None:
+        await self._write("execute_many", query, values, "many")
+
+    async def execute_script(self, statements: Sequence[str]) -> None:
+        """Run several statements atomically, either all of them are committed or none"""
+        await self._write("execute", "", statements, "script")
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.commit_window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                if (remaining := deadline - loop.time()) <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._write_executor, self._commit, batch)
+            except Exception as exc:  # The transaction itself failed, nothing in the batch was written
+                results = [exc] * len(batch)
+            self.commit_latency.observe(time.perf_counter() - start)
+            self.commits += 1
+            self.batched_writes += len(batch)
+
+            for write, result in zip(batch, results):
+                if not write.future.done():
+                    if isinstance(result, Exception):
+                        write.future.set_exception(result)
+                    else:
+                        write.future.set_result(result)
+                self._queue.task_done()
+
+    def _commit(self, batch: list[_Write]) -> list[Any]:
+        """Runs on the writer thread, one transaction with a savepoint per statement"""
+        connection = self._write_connection
+        results: list[Any] = []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for write in batch:
+                connection.execute("SAVEPOINT statement")
+                try:
+                    if write.kind == "many":
+                        connection.executemany(write.query, write.values)
+                        results.append(None)
+                    elif write.kind == "script":
+                        for statement in write.values:
+                            connection.execute(statement)
+                        results.append(None)
+                    else:
+                        results.append(connection.execute(write.query, write.values).lastrowid)
+                    connection.execute("RELEASE statement")
+                except sqlite3.Error as exc:
+                    connection.execute("ROLLBACK TO statement")
+                    connection.execute("RELEASE statement")
+                    results.append(exc)
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        return results
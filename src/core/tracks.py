@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+from typing import Any, Optional, TYPE_CHECKING, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import asyncio
+import json
+import logging
+import re
+import time
+
+if TYPE_CHECKING:
+    from discord.ext import commands
+
+    from .bot import Asahi
+
+from pomice import Playlist, SearchType, Track
+from pomice.pool import Node, SPOTIFY_URL_REGEX, URL_REGEX
+
+from exts.cache import LRUCache, MISSING
+
+LOGGER = logging.getLogger("music-master")
+
+SEARCH_RE = re.compile(r"(?:ytm?|sc)search:.")
+TRACKING_PARAMS = {"si", "feature", "pp", "ab_channel", "utm_source", "utm_medium", "utm_campaign"}
+DEFAULT_TTLS = {"search": 86400, "youtube": 604800, "soundcloud": 604800, "spotify": 86400, "http": 3600}
+
+Result = Union[Playlist, list[Track], None]
+
+
+def normalize_query(query: str, search_type: SearchType = SearchType.ytsearch) -> str:
+    """The key a query is cached under, with the search prefix pomice would add and URL noise stripped"""
+    query = query.strip()
+    if URL_REGEX.match(query):
+        parts = urlsplit(query)
+        params = [(k, v) for k, v in parse_qsl(parts.query) if k not in TRACKING_PARAMS]
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), urlencode(params), ""))
+    if not SEARCH_RE.match(query):
+        query = f"{search_type}:{query}"
+    prefix, _, terms = query.partition(":")
+    return f"{prefix}:{' '.join(terms.casefold().split())}"
+
+
+def source_of(key: str) -> str:
+    if SEARCH_RE.match(key):
+        return "search"
+    if SPOTIFY_URL_REGEX.match(key):
+        return "spotify"
+    host = urlsplit(key).netloc
+    if host.endswith(("youtube.com", "youtu.be")):
+        return "youtube"
+    if host.endswith("soundcloud.com"):
+        return "soundcloud"
+    return "http"
+
+
+class _SpotifyPlaylist:
+    """What a cached Spotify playlist keeps of the Spotify API object"""
+
+    __slots__ = ("name", "image", "uri")
+
+    def __init__(self, name: str, image: Optional[str], uri: Optional[str]):
+        self.name = name
+        self.image = image
+        self.uri = uri
+
+
+def _dump(result: Result) -> Optional[dict[str, Any]]:
+    """Encoded tracks and metadata of a result, None for results that shouldn't be cached"""
+    tracks = result.tracks if isinstance(result, Playlist) else result
+    if not tracks or any(t.is_stream for t in tracks):
+        return None
+    return _encode(result)
+
+
+def _encode(result: Union[Playlist, list[Track]]) -> dict[str, Any]:
+    tracks = result.tracks if isinstance(result, Playlist) else result
+    payload: dict[str, Any] = {
+        "tracks": [{"track": t.track_id, "info": t.info} for t in tracks],
+        "spotify": tracks[0].spotify,
+        "search_type": str(tracks[0]._search_type),
+    }
+    if isinstance(result, Playlist):
+        payload["playlist_info"] = result.playlist_info
+        if result.spotify:
+            payload["image"], payload["uri"] = result.spotify_playlist.image, result.spotify_playlist.uri
+    return payload
+
+
+def _load(payload: dict[str, Any], ctx: Optional[commands.Context]) -> Result:
+    """Build fresh tracks for the requesting context from a cached payload"""
+    if not payload["spotify"]:
+        if "playlist_info" in payload:
+            return Playlist(playlist_info=payload["playlist_info"], tracks=payload["tracks"], ctx=ctx)
+        return [Track(track_id=t["track"], info=t["info"], ctx=ctx) for t in payload["tracks"]]
+    search_type = SearchType(payload["search_type"])
+    tracks = [
+        Track(track_id=t["track"], info=t["info"], ctx=ctx, spotify=True, search_type=search_type)
+        for t in payload["tracks"]
+    ]
+    if "playlist_info" not in payload:
+        return tracks
+    info = payload["playlist_info"]
+    return Playlist(
+        playlist_info=info,
+        tracks=tracks,
+        ctx=ctx,
+        spotify=True,
+        spotify_playlist=_SpotifyPlaylist(info.get("name"), payload.get("image"), payload.get("uri")),
+    )
+
+
+class TrackCache:
+    """Search results and loaded tracks shared by every guild, in front of Lavalink's loadtracks
+
+    An in-memory LRU in front of the Track_Cache table, which keeps entries across restarts. Entries are keyed
+    by the normalized query and expire after the TTL of their source. Streams and empty results aren't cached.
+    """
+
+    def __init__(self, bot: Asahi, *, maxsize: int = 5000, ttls: Optional[dict[str, float]] = None):
+        self.bot = bot
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.memory: LRUCache[str, dict[str, Any]] = LRUCache(maxsize)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.db_hits + self.misses
+        return (self.memory_hits + self.db_hits) / total if total else 0.0
+
+    async def get_tracks(
+        self,
+        node: Node,
+        query: str,
+        *,
+        ctx: Optional[commands.Context] = None,
+        search_type: SearchType = SearchType.ytsearch,
+    ) -> Result:
+        """`Node.get_tracks`, answered from the cache when possible"""
+        key = normalize_query(query, search_type)
+        if (payload := self.memory.get(key, MISSING)) is not MISSING:
+            self.memory_hits += 1
+            return _load(payload, ctx)
+        if key not in self._inflight:  # Concurrent requests for the same query share one lookup
+            task = asyncio.create_task(self._lookup(node, key, query, search_type))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        payload, result = await asyncio.shield(self._inflight[key])
+        if payload is not None:
+            return _load(payload, ctx)
+        if not result or not (result.tracks if isinstance(result, Playlist) else result):
+            return result
+        return _load(_encode(result), ctx)  # Not cached, but every waiter still gets tracks of their own
+
+    async def _lookup(
+        self, node: Node, key: str, query: str, search_type: SearchType
+    ) -> tuple[Optional[dict[str, Any]], Result]:
+        row = await self.bot.db.fetch_one(
+            "SELECT payload, expires_at FROM Track_Cache WHERE query = :query", {"query": key}
+        )
+        if row and row["expires_at"] > time.time():
+            self.db_hits += 1
+            payload = json.loads(row["payload"])
+            self.memory.set(key, payload, ttl=row["expires_at"] - time.time())
+            return payload, None
+
+        self.misses += 1
+        result = await node.get_tracks(query, search_type=search_type)
+        if (payload := _dump(result)) is None:
+            return None, result
+        self.memory.set(key, payload, ttl=self.ttls[source_of(key)])
+        asyncio.create_task(self._persist(key, payload))  # Not worth holding up the play command for
+        return payload, None
+
+    async def _persist(self, key: str, payload: dict[str, Any]) -> None:
+        try:
+            await self.bot.db.execute(
+                "INSERT OR REPLACE INTO Track_Cache (query, source, payload, expires_at) "
+                "VALUES (:query, :source, :payload, :expires_at)",
+                {
+                    "query": key,
+                    "source": source_of(key),
+                    "payload": json.dumps(payload, separators=(",", ":")),
+                    "expires_at": time.time() + self.ttls[source_of(key)],
+                },
+            )
+        except Exception as exc:  # Still served from memory
+            LOGGER.warning(f"Couldn't persist the track cache entry for {key}: {exc!r}")
+
+    async def prune(self) -> None:
+        """Delete expired entries from the table"""
+        await self.bot.db.execute("DELETE FROM Track_Cache WHERE expires_at <= :now", {"now": time.time()})
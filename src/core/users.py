@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from typing import Iterable, Optional, TYPE_CHECKING
+import asyncio
+
+if TYPE_CHECKING:
+    from .bot import Asahi
+
+import discord
+
+from exts.cache import LRUCache, MISSING
+
+
+class UserResolver:
+    """Resolves user IDs with deduplication, bounded concurrency and an LRU+TTL cache
+
+    Users already in the gateway cache never cost a request. Fetched users are cached (with their banner),
+    and accounts that no longer exist are cached as None so they aren't looked up again until they expire.
+    """
+
+    def __init__(
+        self, bot: Asahi, *, maxsize: int = 2048, ttl: float = 3600, negative_ttl: float = 600, concurrency: int = 5
+    ):
+        self.bot = bot
+        self.negative_ttl = negative_ttl
+        self.cache: LRUCache[int, Optional[discord.User]] = LRUCache(maxsize, ttl)
+        self.lookups = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: dict[int, asyncio.Task] = {}
+
+    async def resolve(self, user_id: int, *, fetch: bool = False) -> Optional[discord.User]:
+        """Resolve a single user, None if the account doesn't exist.
+
+        With `fetch` the gateway cache is skipped in favour of a REST fetched user, which carries a banner.
+        """
+        if not fetch and (user := self.bot.get_user(user_id)):
+            return user
+        if (cached := self.cache.get(user_id, MISSING)) is not MISSING:
+            return cached
+        if user_id not in self._inflight:  # Concurrent callers for the same ID share one request
+            task = asyncio.create_task(self._fetch(user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(self._inflight[user_id])
+
+    async def resolve_many(self, user_ids: Iterable[int]) -> dict[int, Optional[discord.User]]:
+        """Resolve every unique ID concurrently, returning an ID to user mapping"""
+        unique = list(dict.fromkeys(user_ids))
+        return dict(zip(unique, await asyncio.gather(*(self.resolve(u) for u in unique))))
+
+    async def banner(self, user_id: int) -> Optional[discord.Asset]:
+        """A user's profile banner, which is only available on fetched users"""
+        user = await self.resolve(user_id, fetch=True)
+        return user.banner if user else None
+
+    def invalidate(self, user_id: int) -> None:
+        self.cache.pop(user_id)
+
+    async def _fetch(self, user_id: int) -> Optional[discord.User]:
+        async with self._semaphore:
+            self.lookups += 1
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                self.cache.set(user_id, None, ttl=self.negative_ttl)
+                return None
+        self.cache.set(user_id, user)
+        return user
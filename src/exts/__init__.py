@@ -1,2 +1,9 @@
+from .cache import *
+from .events import *
 from .helpers import *
+from .http import *
+from .images import *
+from .lavalink import *
+from .metrics import *
 from .paginator import *
+from .queue import *
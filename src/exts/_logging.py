@@ -1,11 +1,21 @@
 from datetime import datetime
-from types import TracebackType
+from typing import BinaryIO, Optional, TextIO
+import atexit
+import copy
+import gzip
+import json
 import logging
+import os
+import queue
+import shutil
+import sys
 import threading
 import traceback
 
 from colorama import Fore, init, Style
 
+from .helpers import Config
+
 init()
 
 colors = {
@@ -33,55 +43,235 @@ names = {
     "music-master": Fore.GREEN,
 }
 
-lock = threading.Lock()
+PADDING = " " * 17
 
 
-class LoggingHandler(logging.StreamHandler):
-    def emit(self, record: logging.LogRecord) -> None:
-        name = record.name
-        # noinspection PyStatementEffect
-        level = record.levelno  # noqa F841
-        level_name = record.levelname
-        if name == "asahi":
-            split = str(record.msg).split(";")
-            if len(split) == 1:
-                sub = None
-                message = split[0]
-            else:
+class RotatingFileSink:
+    """Plain file sink that gzips the current file away once it grows past `max_bytes`"""
+
+    def __init__(self, path: str, *, max_bytes: int = 10 * 1024**2, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file: BinaryIO = open(path, "ab")
+        self._size = self._file.tell()
+
+    def write(self, data: str) -> None:
+        encoded = data.encode("utf-8")  # Sized in bytes, not characters
+        self._file.write(encoded)
+        self._size += len(encoded)
+        if self._size >= self.max_bytes:
+            self.rotate()
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def rotate(self) -> None:
+        """Shift `path.N.gz` backups up by one and compress the current file into `path.1.gz`"""
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}.gz"):
+                os.replace(f"{self.path}.{i}.gz", f"{self.path}.{i + 1}.gz")
+        if self.backups:
+            with open(self.path, "rb") as src, gzip.open(f"{self.path}.1.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        self._file = open(self.path, "wb")
+        self._size = 0
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class LogWriter:
+    """Formats and writes log records on a background thread
+
+    Records are handed over through a bounded queue so logging never blocks the event loop.
+    When the queue is full new records are dropped and counted instead.
+    """
+
+    def __init__(
+        self,
+        *,
+        fmt: str = "pretty",
+        stream: TextIO = sys.stdout,
+        file: Optional[RotatingFileSink] = None,
+        maxsize: int = 10000,
+        batch: int = 256,
+    ):
+        self.fmt = fmt
+        self.stream = stream
+        self.file = file
+        self.batch = batch
+        self.dropped = 0
+        self.written = 0
+        self.max_depth = 0
+        self._queue: queue.Queue[Optional[logging.LogRecord]] = queue.Queue(maxsize)
+        self._stamp: tuple[int, str] = (0, "")
+        self._thread = threading.Thread(target=self._run, name="asahi-log-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, record: logging.LogRecord) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if (depth := self._queue.qsize()) > self.max_depth:
+            self.max_depth = depth
+
+    def stop(self, timeout: float = 5) -> None:
+        """Flush everything queued so far and stop the writer thread"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            records = [self._queue.get()]
+            while len(records) < self.batch:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in records
+            chunk, plain = [], []
+            for record in records:
+                if record is None:
+                    continue
+                try:
+                    lines, plain_lines = self._format(record)
+                except Exception:
+                    lines = plain_lines = [f"Failed to format log record from {record.name}: {record.msg!r}"]
+                chunk.extend(lines)
+                plain.extend(plain_lines)
+
+            if chunk:
+                try:
+                    self.stream.write("\n".join(chunk) + "\n")
+                    self.stream.flush()
+                    if self.file:
+                        self.file.write("\n".join(plain) + "\n")
+                        self.file.flush()
+                    self.written += len(records) - records.count(None)
+                except OSError:  # A closed or full output must not kill the writer thread
+                    self.dropped += len(records) - records.count(None)
+            if stop:
+                if self.file:
+                    self.file.close()
+                return
+
+    def _timestamp(self, created: float) -> str:
+        """strftime only once per second instead of once per record"""
+        second = int(created)
+        if self._stamp[0] != second:
+            self._stamp = (second, datetime.fromtimestamp(second).strftime("%x %X"))
+        return self._stamp[1]
+
+    def _format(self, record: logging.LogRecord) -> tuple[list[str], list[str]]:
+        """Returns the lines for the console and for the file sink"""
+        message = record.getMessage()
+        sub = None
+        if record.name == "asahi":
+            split = message.split(";")
+            if len(split) > 1:
                 sub = split[0]
                 message = ";".join(split[1:])
-        else:
-            message = record.msg
-            sub = None
-
-        message %= record.args
-        with lock:
-            first = True
-            for line in message.splitlines():
-                print(
-                    f"{datetime.now().strftime('%x %X') if first else '                 '}"
-                    f" "
-                    f"{colors2[level_name]}{styles[level_name]}[{level_name}]{Style.RESET_ALL}"
-                    f" "
-                    f"{Style.BRIGHT}{names[name]}{name}{Style.RESET_ALL} "
-                    + (f"» {Style.BRIGHT}{Fore.LIGHTBLUE_EX}{sub}{Style.RESET_ALL} " if sub else "")
-                    + f"» "
-                    f"{colors[level_name]}{line}{Style.RESET_ALL}"
-                )
-                first = False
-
-            if record.exc_info:
-                exception: tuple[type, BaseException, TracebackType] = record.exc_info
-                lines = traceback.format_exception(*exception)
-                for line in lines:
-                    for msg in line.splitlines():
-                        print(
-                            f"                 "
-                            f" "
-                            f"{colors2[level_name]}{styles[level_name]}[{level_name[:3]}]{Style.RESET_ALL}"
-                            f" "
-                            f"{Style.BRIGHT}{names[name]}{name}{Style.RESET_ALL} "
-                            + (f"» {Style.BRIGHT}{Fore.LIGHTBLUE_EX}{sub}{Style.RESET_ALL} " if sub else "")
-                            + f"» "
-                            f"{colors[level_name]}{msg}{Style.RESET_ALL}"
-                        )
+
+        tb = record.exc_text  # Formatted by LoggingHandler.prepare
+
+        if self.fmt == "json":
+            line = json.dumps(
+                {
+                    "time": datetime.fromtimestamp(record.created).isoformat(),
+                    "level": record.levelname,
+                    "logger": record.name,
+                    "sub": sub,
+                    "message": message,
+                    "exception": tb,
+                },
+                default=str,
+            )
+            return [line], [line]
+
+        level_name = record.levelname
+        stamp = self._timestamp(record.created)
+        source = f"{record.name} " + (f"» {sub} " if sub else "")
+        lines, plain = [], []
+        tag = (
+            f"{colors2[level_name]}{styles[level_name]}[{level_name}]{Style.RESET_ALL} "
+            f"{Style.BRIGHT}{names.get(record.name, '')}{record.name}{Style.RESET_ALL} "
+            + (f"» {Style.BRIGHT}{Fore.LIGHTBLUE_EX}{sub}{Style.RESET_ALL} " if sub else "")
+        )
+        for num, line in enumerate(message.splitlines() or [""]):
+            lines.append(f"{stamp if num == 0 else PADDING} {tag}» {colors[level_name]}{line}{Style.RESET_ALL}")
+            plain.append(f"{stamp if num == 0 else PADDING} [{level_name}] {source}» {line}")
+
+        if tb:
+            tag = tag.replace(f"[{level_name}]", f"[{level_name[:3]}]", 1)
+            for line in tb.splitlines():
+                lines.append(f"{PADDING} {tag}» {colors[level_name]}{line}{Style.RESET_ALL}")
+                plain.append(f"{PADDING} [{level_name[:3]}] {source}» {line}")
+        return lines, plain
+
+
+_writer: Optional[LogWriter] = None
+
+
+def get_writer() -> LogWriter:
+    """The process wide log writer, started on first use"""
+    global _writer
+    if _writer is None:
+        config = Config()
+        path = config.get("log_file", "")
+        _writer = LogWriter(
+            fmt=config.get("log_format", "pretty"),
+            file=RotatingFileSink(
+                path,
+                max_bytes=config.get("log_max_bytes", 10 * 1024**2),
+                backups=config.get("log_backups", 5),
+            )
+            if path
+            else None,
+            maxsize=config.get("log_queue_size", 10000),
+        )
+        atexit.register(_writer.stop)
+    return _writer
+
+
+class LoggingHandler(logging.Handler):
+    """Hands records to the background log writer, which formats them into lines off the calling thread
+
+    The message and traceback are resolved before the handoff, like `logging.handlers.QueueHandler.prepare`
+    does, so arguments mutated after the call don't change what's logged and tracebacks aren't kept alive
+    in the queue.
+    """
+
+    def __init__(self, level: int = logging.NOTSET):
+        super().__init__(level)
+        self.writer = get_writer()
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # Skips the per-handler lock logging.Handler.handle takes, submitting to the queue is already thread safe
+        if passed := self.filter(record):
+            self.emit(record)
+        return bool(passed)
+
+    @staticmethod
+    def prepare(record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)  # Other handlers still get the original
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+        record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.writer.submit(self.prepare(record))
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Iterator, Optional, TypeVar
+import time
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+MISSING: Any = object()
+
+
+class LRUCache(Generic[K, V]):
+    """Size bounded mapping that evicts the least recently used entry, with optional per-entry expiry"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, tuple[Optional[float], V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key, MISSING, record=False) is not MISSING
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(list(self._data))
+
+    def get(self, key: K, default: Any = None, *, record: bool = True) -> Any:
+        """Get a value and mark it as recently used. Expired entries are dropped and count as a miss"""
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            self.misses += record
+            return default
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            self.misses += record
+            return default
+        self._data.move_to_end(key)
+        self.hits += record
+        return value
+
+    def set(self, key: K, value: V, *, ttl: Optional[float] = MISSING) -> None:
+        """Insert or replace a value. `ttl` overrides the cache wide expiry for this entry, None never expires"""
+        ttl = self.ttl if ttl is MISSING else ttl
+        self._data[key] = (time.monotonic() + ttl if ttl is not None else None, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,69 @@
+from collections import Counter, deque
+from typing import Optional
+import logging
+import random
+import time
+
+
+class CommandEvent:
+    """Structured record of one finished command invocation"""
+
+    __slots__ = ("command", "guild_id", "shard_id", "user_id", "latency", "outcome", "timestamp")
+
+    def __init__(
+        self,
+        command: str,
+        *,
+        guild_id: Optional[int],
+        shard_id: Optional[int],
+        user_id: int,
+        latency: float,
+        outcome: str = "ok",
+    ):
+        self.command = command
+        self.guild_id = guild_id
+        self.shard_id = shard_id
+        self.user_id = user_id
+        self.latency = latency
+        self.outcome = outcome
+        self.timestamp = time.time()
+
+    def __str__(self) -> str:
+        # Only rendered by the log writer, and only for events that were sampled
+        return (
+            f"{self.command} | outcome={self.outcome} latency={self.latency * 1000:.1f}ms "
+            f"guild={self.guild_id or 'DM'} shard={self.shard_id} user={self.user_id}"
+        )
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class EventSink:
+    """Collects command events into a ring buffer and per-command counters
+
+    Every event is counted, but only a configurable sample per command is logged.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        *,
+        capacity: int = 1000,
+        sampling: Optional[dict[str, float]] = None,
+    ):
+        self.logger = logger
+        self.recent: deque[CommandEvent] = deque(maxlen=capacity)
+        self.counts: Counter[tuple[str, str]] = Counter()  # (command, outcome) -> invocations
+        self.sampling = dict(sampling or {})
+        self.default_rate = self.sampling.pop("default", 1.0)
+
+    def sampled(self, command: str) -> bool:
+        rate = self.sampling.get(command, self.default_rate)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def push(self, event: CommandEvent) -> None:
+        self.recent.append(event)
+        self.counts[(event.command, event.outcome)] += 1
+        if self.logger.isEnabledFor(logging.INFO) and self.sampled(event.command):
+            self.logger.info("commands;%s", event)
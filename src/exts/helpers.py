@@ -5,6 +5,9 @@ from humanize import naturaldelta, precisedelta
 import toml
 
 
+_MISSING: Any = object()
+
+
 class ConfigKeyNotFound(KeyError):
     pass
 
@@ -12,10 +15,12 @@ class ConfigKeyNotFound(KeyError):
 class Config:
     master: dict = toml.load("./src/core/data/config.toml")
 
-    def get(self, key: str) -> Any:
+    def get(self, key: str, default: Any = _MISSING) -> Any:
         try:
             return self.master[key]
         except KeyError:
+            if default is not _MISSING:
+                return default
             raise ConfigKeyNotFound(f"No config with key: '{key}' was found.")
 
 
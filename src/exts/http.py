@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Optional
+import asyncio
+import logging
+import time
+
+from yarl import URL
+import aiohttp
+
+from .metrics import Histogram
+
+LOGGER = logging.getLogger("asahi")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Raised when a request to an upstream API could not be completed"""
+
+
+class CircuitOpen(UpstreamError):
+    """Raised without sending a request while a host's circuit breaker is open"""
+
+
+class HostStats:
+    """Request latency and error counters for a single upstream host
+
+    Besides lifetime totals a rolling window of recent requests is kept for percentiles and error rates.
+    """
+
+    __slots__ = (
+        "requests",
+        "errors",
+        "retries",
+        "rejected",
+        "total_latency",
+        "last_latency",
+        "last_error",
+        "latencies",
+        "outcomes",
+        "histogram",
+    )
+
+    def __init__(self, window: int = 100):
+        self.requests: int = 0
+        self.errors: int = 0
+        self.retries: int = 0
+        self.rejected: int = 0
+        self.total_latency: float = 0.0
+        self.last_latency: float = 0.0
+        self.last_error: Optional[str] = None
+        self.latencies: deque[float] = deque(maxlen=window)  # Successful requests only
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.histogram = Histogram()  # Lifetime latency distribution, for /metrics
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.requests if self.requests else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        """Share of failed requests within the rolling window"""
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile (0-1) of recent successful requests, None without enough samples"""
+        if len(self.latencies) < 5:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def record(self, latency: float, error: Optional[BaseException] = None) -> None:
+        self.requests += 1
+        self.total_latency += latency
+        self.last_latency = latency
+        self.histogram.observe(latency)
+        self.outcomes.append(error is None)
+        if error is not None:
+            self.errors += 1
+            self.last_error = repr(error)
+        else:
+            self.latencies.append(latency)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and lets a single probe through after `cooldown` seconds"""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a request may be sent right now"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def abandon(self) -> None:
+        """Release a probe whose request was cancelled before it finished"""
+        self._probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class WebClient:
+    """Shared HTTP client for upstream APIs
+
+    Wraps a single aiohttp session with a tuned connector, per-request deadlines,
+    bounded retries and a per-host circuit breaker.
+    """
+
+    def __init__(
+        self,
+        *,
+        timeout: float = 10.0,
+        retries: int = 2,
+        limit: int = 100,
+        limit_per_host: int = 10,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30.0,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.stats: dict[str, HostStats] = {}
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> WebClient:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            raise RuntimeError("WebClient.start() must be called before making requests")
+        return self._session
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Create the underlying session"""
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+            enable_cleanup_closed=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout, connect=min(self.timeout, 5))
+        )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        return self.breakers[host]
+
+    def host_stats(self, host: str) -> HostStats:
+        if host not in self.stats:
+            self.stats[host] = HostStats()
+        return self.stats[host]
+
+    def healthy(self, host: str) -> bool:
+        """Whether a host is worth routing requests to right now"""
+        return self.breaker(host).state != "open" and self.host_stats(host).error_rate < 0.5
+
+    async def request_json(
+        self, method: str, url: str, *, json: Optional[dict] = None, timeout: Optional[float] = None
+    ) -> Any:
+        """Send a request and decode its JSON body, retrying transient failures
+
+        Raises UpstreamError once every attempt failed, or CircuitOpen if the host is known to be down.
+        """
+        host = URL(url).host
+        breaker = self.breaker(host)
+        stats = self.host_stats(host)
+        deadline = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        error: Optional[BaseException] = None
+
+        for attempt in range(self.retries + 1):
+            if attempt:  # Backoff before taking the breaker's probe slot, a cancelled sleep holds nothing
+                stats.retries += 1
+                await asyncio.sleep(0.25 * 2 ** (attempt - 1))
+            if not breaker.allow():
+                stats.rejected += 1
+                raise CircuitOpen(f"{host} is currently unavailable")
+
+            start = time.perf_counter()
+            try:
+                async with self.session.request(method, url, json=json, timeout=deadline) as resp:
+                    if resp.status in RETRY_STATUSES:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info, resp.history, status=resp.status, message=resp.reason
+                        )
+                    resp.raise_for_status()
+                    data = await resp.json(content_type=None)
+            except aiohttp.ClientResponseError as e:
+                stats.record(time.perf_counter() - start, e)
+                if e.status not in RETRY_STATUSES:  # Client errors are our fault, don't hold them against the host
+                    breaker.success()
+                    raise UpstreamError(f"{host} responded with {e.status}") from e
+                breaker.failure()
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                stats.record(time.perf_counter() - start, e)
+                breaker.failure()
+                error = e
+            except BaseException:  # Cancelled (e.g. a hedged request that lost) or unexpected, release the probe
+                breaker.abandon()
+                raise
+            else:
+                stats.record(time.perf_counter() - start)
+                breaker.success()
+                return data
+
+        LOGGER.warning(f"http;Request to {host} failed after {self.retries + 1} attempt(s): {error!r}")
+        raise UpstreamError(f"{host} did not respond successfully") from error
+
+    async def get_json(self, url: str, **kwargs) -> Any:
+        return await self.request_json("GET", url, **kwargs)
+
+    async def warmup(self, *urls: str) -> None:
+        """Open keepalive connections to the origins of the given urls ahead of the first real request"""
+
+        async def touch(origin: URL) -> None:
+            try:
+                async with self.session.head(origin, timeout=aiohttp.ClientTimeout(total=5)):
+                    pass
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+
+        origins = {URL(url).origin() for url in urls}
+        await asyncio.gather(*(touch(origin) for origin in origins))
+        LOGGER.info(f"http;Pre-warmed connections to {len(origins)} upstream host(s)")
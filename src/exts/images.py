@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+from collections import Counter, deque
+from itertools import chain
+from typing import Callable, Optional, TYPE_CHECKING
+import asyncio
+import logging
+import time
+
+from yarl import URL
+
+from .http import UpstreamError
+
+if TYPE_CHECKING:
+    from core import Asahi
+
+LOGGER = logging.getLogger("asahi")
+
+
+class ImageProvider:
+    """An upstream API that serves random image urls for a tag"""
+
+    def __init__(
+        self,
+        url: str,
+        parser: Callable[[dict], list[str]],
+        *,
+        bulk_url: Optional[str] = None,
+        bulk_method: str = "GET",
+        bulk_json: Optional[dict] = None,
+    ):
+        self.url = url
+        self.host: str = URL(url).host
+        self.parser = parser
+        self.bulk_url = bulk_url
+        self.bulk_method = bulk_method
+        self.bulk_json = bulk_json
+
+
+PROVIDERS: dict[str, ImageProvider] = {
+    "waifu.im": ImageProvider(
+        "https://api.waifu.im/random/?selected_tags={tag}",
+        lambda data: [i["url"] for i in data["images"]],
+        bulk_url="https://api.waifu.im/random/?selected_tags={tag}&many=true",
+    ),
+    "waifu.pics": ImageProvider(
+        "https://api.waifu.pics/{tag}",
+        lambda data: data["files"] if "files" in data else [data["url"]],
+        bulk_url="https://api.waifu.pics/many/{tag}",
+        bulk_method="POST",
+        bulk_json={"exclude": []},
+    ),
+    "nekos.life": ImageProvider("https://nekos.life/api/v2/img/{tag}", lambda data: [data["url"]]),
+}
+
+# Command name -> every `provider:tag` key that serves images for it
+IMAGE_COMMANDS: dict[str, tuple[str, ...]] = {
+    # Anime
+    "waifu": ("waifu.im:waifu", "waifu.pics:sfw/waifu", "nekos.life:waifu"),
+    "mori": ("waifu.im:mori-calliope",),
+    "marin": ("waifu.im:marin-kitagawa",),
+    "maid": ("waifu.im:maid",),
+    "selfie": ("waifu.im:selfie",),
+    # NSFW
+    "ass": ("waifu.im:ass",),
+    "hentai": ("waifu.im:hentai", "waifu.pics:nsfw/waifu"),
+    "milf": ("waifu.im:milf",),
+    "oral": ("waifu.im:oral", "waifu.pics:nsfw/blowjob"),
+    "paizuri": ("waifu.im:paizuri",),
+    "ecchi": ("waifu.im:ecchi",),
+    # Roleplay
+    "hug": ("waifu.pics:sfw/hug", "nekos.life:hug"),
+    "kiss": ("waifu.pics:sfw/kiss", "nekos.life:kiss"),
+    "pat": ("waifu.pics:sfw/pat", "nekos.life:pat"),
+    "cuddle": ("waifu.pics:sfw/cuddle", "nekos.life:cuddle"),
+    "lick": ("waifu.pics:sfw/lick",),
+    "bully": ("waifu.pics:sfw/bully",),
+    "poke": ("waifu.pics:sfw/poke", "nekos.life:poke"),
+    "slap": ("waifu.pics:sfw/slap", "nekos.life:slap"),
+    "smug": ("waifu.pics:sfw/smug", "nekos.life:smug"),
+    "baka": ("nekos.life:baka",),
+    "feed": ("nekos.life:feed",),
+    "tickle": ("nekos.life:tickle",),
+}
+
+
+class ImagePool:
+    """Background prefetch pool of image urls keyed by `provider:tag`
+
+    Commands ask for an image by name and get a ready url from the pool of their fastest healthy provider,
+    only falling back to a live request when every candidate pool is empty.
+    Live requests are hedged across providers: if the first has not answered within its observed p90
+    the next candidate is raced against it and the first success wins.
+    A pool is refilled in the background once it drops below the low-water mark.
+    """
+
+    def __init__(
+        self, bot: Asahi, *, size: int = 10, low_water: int = 3, ttl: float = 900, hedge_after: float = 1.0
+    ):
+        self.bot = bot
+        self.size = size
+        self.low_water = low_water
+        self.ttl = ttl
+        self.hedge_after = hedge_after  # Used until a provider has enough latency samples
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+        self.hedges: int = 0
+        self._pools: dict[str, deque[tuple[float, str]]] = {}
+        self._refills: dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def resolve(key: str) -> tuple[ImageProvider, str]:
+        """Split a pool key into its provider and tag"""
+        provider, tag = key.split(":", 1)
+        return PROVIDERS[provider], tag
+
+    async def fetch(self, key: str, *, bulk: bool = False) -> list[str]:
+        """Request image urls for a key straight from the upstream API"""
+        provider, tag = self.resolve(key)
+        if bulk and provider.bulk_url:
+            method, url, json = provider.bulk_method, provider.bulk_url.format(tag=tag), provider.bulk_json
+        else:
+            method, url, json = "GET", provider.url.format(tag=tag), None
+        return provider.parser(await self.bot.web.request_json(method, url, json=json))
+
+    def candidates(self, name: str) -> list[str]:
+        """Keys serving an image name, fastest healthy provider first and untried ones after the measured ones
+
+        Raises KeyError for names that are neither an image command nor a `provider:tag` key.
+        """
+        if name in IMAGE_COMMANDS:
+            keys = IMAGE_COMMANDS[name]
+        elif ":" in name and name.split(":", 1)[0] in PROVIDERS:
+            keys = (name,)
+        else:
+            raise KeyError(f"Unknown image {name!r}")
+        web = self.bot.web
+
+        def rank(key: str) -> tuple[bool, float]:
+            host = self.resolve(key)[0].host
+            median = web.host_stats(host).percentile(0.5)
+            return not web.healthy(host), median if median is not None else float("inf")
+
+        return sorted(keys, key=rank)
+
+    def hedge_delay(self, key: str) -> float:
+        """How long to wait on a provider before racing the next one against it"""
+        p90 = self.bot.web.host_stats(self.resolve(key)[0].host).percentile(0.9)
+        return max(p90, 0.05) if p90 is not None else self.hedge_after
+
+    async def get(self, name: str) -> str:
+        """Get an image url for an image name or `provider:tag` key, preferring the prefetched pools"""
+        keys = self.candidates(name)
+        for key in keys:
+            if pool := self._pool(key):
+                self.hits[name] += 1
+                url = pool.popleft()[1]
+                break
+        else:
+            self.misses[name] += 1
+            url = await self.fetch_hedged(keys)
+        if len(self._pool(keys[0])) < self.low_water:
+            self.refill(keys[0])
+        return url
+
+    async def fetch_hedged(self, keys: list[str]) -> str:
+        """Live fetch racing providers in order, returning the first url any of them gives back"""
+        waiting = list(keys)
+        tasks: dict[asyncio.Task, str] = {}
+        error: Optional[BaseException] = None
+        try:
+            while waiting or tasks:
+                delay = None
+                if waiting:
+                    key = waiting.pop(0)
+                    if tasks:
+                        self.hedges += 1
+                    tasks[asyncio.create_task(self.fetch(key))] = key
+                    delay = self.hedge_delay(key) if waiting else None
+
+                done, _ = await asyncio.wait(tasks, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif urls := task.result():
+                        return urls[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+        raise error or UpstreamError("No image provider returned an image")
+
+    @staticmethod
+    def urls() -> list[str]:
+        """Every upstream url the pool may request, used to pre-warm connections"""
+        return [p.url for p in PROVIDERS.values()] + [p.bulk_url for p in PROVIDERS.values() if p.bulk_url]
+
+    def prefetch(self, *names: str) -> None:
+        """Schedule a background fill of the best provider for every image name given"""
+        for name in names:
+            self.refill(self.candidates(name)[0])
+
+    def refill(self, key: str) -> None:
+        """Schedule a background refill for a key unless one is already running"""
+        if key in self._refills:
+            return
+        task = asyncio.create_task(self._refill(key))
+        self._refills[key] = task
+        task.add_done_callback(lambda _: self._refills.pop(key, None))
+
+    async def _refill(self, key: str) -> None:
+        provider, _ = self.resolve(key)
+        pool = self._pool(key)
+        missing = self.size - len(pool)
+        if missing <= 0:
+            return
+
+        if provider.bulk_url:
+            jobs = [self.fetch(key, bulk=True)]
+        else:
+            jobs = [self.fetch(key) for _ in range(missing)]
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        batches = [r for r in results if not isinstance(r, BaseException)]
+        if not batches:
+            return LOGGER.warning(f"images;Failed to refill image pool '{key}': {results[0]!r}")
+
+        now = time.monotonic()
+        seen = {url for _, url in pool}
+        for url in chain.from_iterable(batches):
+            if len(pool) >= self.size:
+                break
+            if url not in seen:
+                seen.add(url)
+                pool.append((now, url))
+
+    def _pool(self, key: str) -> deque[tuple[float, str]]:
+        """Get the pool for a key with stale entries dropped"""
+        pool = self._pools.setdefault(key, deque())
+        deadline = time.monotonic() - self.ttl
+        while pool and pool[0][0] < deadline:  # Entries are appended in fetch order, oldest are on the left
+            pool.popleft()
+        return pool
+
+    def stats(self) -> list[tuple[str, int, int, int]]:
+        """Returns (name, pooled, hits, misses) for every requested image name"""
+        names = {n for n, keys in IMAGE_COMMANDS.items() if any(k in self._pools for k in keys)}
+        return [
+            (n, sum(len(self._pool(k)) for k in self.candidates(n)), self.hits[n], self.misses[n])
+            for n in sorted(names | self.hits.keys() | self.misses.keys())
+        ]
+
+    def close(self) -> None:
+        """Cancel every pending refill"""
+        for task in list(self._refills.values()):
+            task.cancel()
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from typing import Any, Optional, TYPE_CHECKING
+import asyncio
+import logging
+import time
+
+import aiohttp
+import pomice
+
+if TYPE_CHECKING:
+    from core import Asahi
+
+LOGGER = logging.getLogger("music-master")
+
+CLOSED = (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR)
+
+
+class LavalinkNode(pomice.Node):
+    """pomice's node, keeping the frame stats Lavalink reports and telling its manager when it goes down or comes
+    back instead of retrying silently while still being handed players"""
+
+    def __init__(self, *, manager: NodeManager, **kwargs):
+        super().__init__(**kwargs)
+        self.manager = manager
+        self.frames_sent = 0
+        self.frames_nulled = 0
+        self.frames_deficit = 0
+        self.last_stats = 0.0
+        self.failures = 0
+
+    @property
+    def healthy(self) -> bool:
+        return bool(self._available) and self.is_connected
+
+    @property
+    def stats(self) -> Optional[pomice.NodeStats]:
+        return getattr(self, "_stats", None)  # Only set once Lavalink sent its first stats
+
+    async def _handle_payload(self, data: dict) -> None:
+        if data.get("op") == "stats":
+            frames = data.get("frameStats") or {}
+            self.frames_sent = frames.get("sent", 0)
+            self.frames_nulled = frames.get("nulled", 0)
+            self.frames_deficit = frames.get("deficit", 0)
+            self.last_stats = time.monotonic()
+        await super()._handle_payload(data)
+
+    async def _listen(self) -> None:
+        while True:
+            msg = await self._websocket.receive()
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                asyncio.create_task(self._handle_payload(msg.json()))
+                continue
+            if msg.type not in CLOSED:
+                continue
+            self._available = False
+            self.failures += 1
+            LOGGER.error(f"Lost connection to node {self._identifier}: {msg.extra!r}")
+            self.manager.node_lost(self)
+            await self._reconnect()
+            self.manager.node_restored(self)
+
+    async def _reconnect(self) -> None:
+        delay = 1
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                self._websocket = await self._session.ws_connect(
+                    self._websocket_uri, headers=self._headers, heartbeat=self._heartbeat
+                )
+            except (aiohttp.ClientError, OSError) as exc:
+                LOGGER.warning(f"Reconnecting to node {self._identifier} failed: {exc!r}, retrying in {delay}s")
+                delay = min(delay * 2, 60)
+                continue
+            self._available = True
+            LOGGER.info(f"Reconnected to node {self._identifier}")
+            return
+
+
+class NodeManager:
+    """Connects the configured Lavalink nodes, places players on the least loaded one and moves players off
+    nodes that go down
+
+    Load is scored the way Lavalink's own client does it: playing players, plus penalties growing exponentially
+    with system CPU load and with the share of frames that were late or missing in the last minute.
+    """
+
+    def __init__(self, bot: Asahi, *, migration_concurrency: int = 10):
+        self.bot = bot
+        self.pool = pomice.NodePool()
+        self.migrations = 0
+        self._semaphore = asyncio.Semaphore(migration_concurrency)
+        self._connecting: dict[str, asyncio.Task] = {}
+
+    @property
+    def nodes(self) -> dict[str, LavalinkNode]:
+        return self.pool.nodes
+
+    def node_configs(self) -> list[dict[str, Any]]:
+        """The [[lavalink_nodes]] tables, or the single ll_host node from older configs"""
+        config = self.bot.config
+        if nodes := config.get("lavalink_nodes", []):
+            return nodes
+        return [
+            {
+                "identifier": "MAIN",
+                "host": config.get("ll_host"),
+                "port": config.get("ll_port"),
+                "password": config.get("ll_password"),
+            }
+        ]
+
+    async def start(self) -> None:
+        """Connect every configured node, returning once one of them is up
+
+        Nodes that aren't reachable yet keep being retried in their own tasks.
+        """
+        await self.bot.wait_until_ready()
+        for node_config in self.node_configs():
+            identifier = node_config["identifier"]
+            if identifier not in self.nodes and identifier not in self._connecting:
+                task = asyncio.create_task(self._connect(node_config))
+                self._connecting[identifier] = task
+                task.add_done_callback(lambda _, identifier=identifier: self._connecting.pop(identifier, None))
+        if self._connecting and not any(node.healthy for node in self.nodes.values()):
+            await asyncio.wait(list(self._connecting.values()), return_when=asyncio.FIRST_COMPLETED)
+
+    async def _connect(self, node_config: dict[str, Any]) -> None:
+        identifier = node_config["identifier"]
+        node = LavalinkNode(
+            manager=self,
+            pool=pomice.NodePool,
+            bot=self.bot,
+            host=node_config["host"],
+            port=node_config["port"],
+            password=node_config["password"],
+            identifier=identifier,
+            secure=node_config.get("secure", False),
+            spotify_client_id=self.bot.config.get("spotify_client_id"),
+            spotify_client_secret=self.bot.config.get("spotify_client_secret"),
+        )
+        delay = 5
+        while True:
+            try:
+                await node.connect()
+                break
+            except Exception as exc:  # Whatever went wrong, keep retrying
+                LOGGER.error(f"Couldn't connect to node {identifier}: {exc!r}, retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 300)
+        self.nodes[identifier] = node
+        LOGGER.info(f"Sucessfully created Node: {identifier}")
+
+    @staticmethod
+    def penalty(node: LavalinkNode) -> float:
+        players = node.player_count
+        cpu = frames = 0.0
+        if stats := node.stats:
+            players = max(players, stats.players_active or 0)
+            cpu = 1.05 ** (100 * (stats.cpu_system_load or 0)) * 10 - 10
+        if node.frames_sent or node.frames_deficit or node.frames_nulled:
+            # Lavalink expects 3000 frames per player per minute
+            frames = 1.03 ** (500 * node.frames_deficit / 3000) * 600 - 600
+            frames += (1.03 ** (500 * node.frames_nulled / 3000) * 300 - 300) * 2
+        return players + cpu + frames
+
+    def best_node(self, *, exclude: Optional[LavalinkNode] = None) -> LavalinkNode:
+        nodes = [node for node in self.nodes.values() if node.healthy and node is not exclude]
+        if not nodes:
+            raise pomice.NoNodesAvailable("There are no nodes available.")
+        return min(nodes, key=self.penalty)
+
+    def node_lost(self, node: LavalinkNode) -> None:
+        if node.players:
+            asyncio.create_task(self._migrate(node, list(node.players.values())))
+
+    def node_restored(self, node: LavalinkNode) -> None:
+        """Players nobody could take while the node was down get their session on it back"""
+        if node.players:
+            asyncio.create_task(self._migrate(node, list(node.players.values()), target=node))
+
+    async def _migrate(
+        self, node: LavalinkNode, players: list[pomice.Player], *, target: Optional[LavalinkNode] = None
+    ) -> None:
+        async def move(player: pomice.Player) -> bool:
+            async with self._semaphore:
+                try:
+                    await player.move_to(target or self.best_node(exclude=node))
+                    return True
+                except pomice.NoNodesAvailable:
+                    return False
+                except Exception as exc:
+                    LOGGER.error(f"Moving the player for {player.guild} off {node._identifier} failed: {exc!r}")
+                    return False
+
+        moved = sum(await asyncio.gather(*(move(p) for p in players)))
+        self.migrations += moved
+        LOGGER.info(f"Moved {moved}/{len(players)} players off node {node._identifier}")
+
+    async def ping(self, node: LavalinkNode) -> Optional[float]:
+        """Round trip of a REST request to the node, None if it didn't answer"""
+        start = time.perf_counter()
+        try:
+            async with node._session.get(
+                f"{node._rest_uri}/version",
+                headers={"Authorization": node._password},
+                timeout=aiohttp.ClientTimeout(total=5),
+            ):
+                return time.perf_counter() - start
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Iterable, Optional, TYPE_CHECKING
+import logging
+import math
+import time
+
+from aiohttp import web
+import psutil
+
+if TYPE_CHECKING:
+    from core import Asahi
+
+LOGGER = logging.getLogger("asahi")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Geometric buckets from 0.5ms to ~23s, 20% apart, fine enough for percentiles
+LATENCY_BUCKETS = tuple(round(0.0005 * 1.2**i, 6) for i in range(60))
+
+PHASES = ("prefix", "context", "checks", "converters", "body")
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Histogram:
+    """Fixed bucket histogram, constant memory no matter how many values are observed"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets: tuple[float, ...] = tuple(buckets)
+        self.counts: list[int] = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile (0-1) by interpolating within the bucket it falls into"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen, lower = 0, 0.0
+        for i, count in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else lower  # Nothing is known above the last bound
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return lower
+
+    def render(self, name: str, **labels) -> list[str]:
+        lines, total = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            le = "+Inf" if bound == math.inf else repr(bound)
+            lines.append(f"{name}_bucket{_labels(**labels, le=le)} {total}")
+        lines.append(f"{name}_sum{_labels(**labels)} {self.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {self.count}")
+        return lines
+
+
+class InvocationTimer:
+    """Splits one command invocation into phases, plus time spent waiting on Discord's HTTP API
+
+    Time is attributed to the current phase until `enter` moves on to the next one.
+    """
+
+    __slots__ = ("phase", "phases", "http", "_since")
+
+    def __init__(self, phase: str, *, since: Optional[float] = None):
+        self.phase: Optional[str] = phase
+        self.phases: dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.http: float = 0.0
+        self._since = time.perf_counter() if since is None else since
+
+    def enter(self, phase: Optional[str]) -> None:
+        now = time.perf_counter()
+        if self.phase is not None:
+            self.phases[self.phase] += now - self._since
+        self.phase = phase
+        self._since = now
+
+    def finish(self) -> None:
+        self.enter(None)
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+
+CURRENT_TIMER: ContextVar[Optional[InvocationTimer]] = ContextVar("current_timer", default=None)
+
+
+class CommandProfile:
+    """Fixed memory latency histograms of one command, per phase"""
+
+    __slots__ = ("total", "http", "phases", "total_time")
+
+    def __init__(self):
+        self.total = Histogram(LATENCY_BUCKETS)
+        self.http = Histogram(LATENCY_BUCKETS)
+        self.phases: dict[str, Histogram] = {phase: Histogram(LATENCY_BUCKETS) for phase in PHASES}
+        self.total_time: float = 0.0
+
+    def observe(self, timer: InvocationTimer) -> None:
+        total = timer.total
+        self.total.observe(total)
+        self.http.observe(timer.http)
+        self.total_time += total
+        for phase, elapsed in timer.phases.items():
+            self.phases[phase].observe(elapsed)
+
+
+class PlaybackStats:
+    """Time between a track ending and the next one starting, overall and per guild, and idle players reclaimed"""
+
+    __slots__ = ("gaps", "guild_gaps", "prefetched", "resolved_late", "reclaimed")
+
+    def __init__(self):
+        self.gaps = Histogram(LATENCY_BUCKETS)
+        self.guild_gaps: dict[int, Histogram] = {}
+        self.prefetched = 0  # Next track was already resolved when the current one ended
+        self.resolved_late = 0  # Had to be searched for after it
+        self.reclaimed = 0  # Idle players destroyed by the music cog's reaper
+
+    def observe(self, guild_id: int, gap: float) -> None:
+        self.gaps.observe(gap)
+        if (histogram := self.guild_gaps.get(guild_id)) is None:
+            histogram = self.guild_gaps[guild_id] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(gap)
+
+    def forget(self, guild_id: int) -> None:
+        self.guild_gaps.pop(guild_id, None)
+
+
+class Metrics:
+    """Renders the bot's runtime state in the Prometheus text exposition format
+
+    Values are read from the components that already keep them when a scrape comes in.
+    """
+
+    def __init__(self, bot: Asahi):
+        self.bot = bot
+        self.process = psutil.Process()
+        self.process.cpu_percent()  # First call only sets the baseline
+
+    def render(self) -> str:
+        bot = self.bot
+        lines: list[str] = []
+
+        def metric(name: str, kind: str, doc: str, samples: Iterable[tuple[dict, float]]) -> None:
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_labels(**labels)} {value}" for labels, value in samples)
+
+        def histograms(name: str, doc: str, label: str, items: Iterable[tuple[str, Histogram]]) -> None:
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in items:
+                lines.extend(histogram.render(name, **{label: key}))
+
+        events = bot.command_events
+        metric(
+            "asahi_commands_total",
+            "counter",
+            "Finished command invocations",
+            (({"command": c, "outcome": o}, n) for (c, o), n in events.counts.items()),
+        )
+        profiles = bot.command_profiles
+        histograms(
+            "asahi_command_duration_seconds",
+            "Command latency",
+            "command",
+            ((c, profile.total) for c, profile in profiles.items()),
+        )
+        histograms(
+            "asahi_command_http_seconds",
+            "Time commands spent waiting on Discord's HTTP API",
+            "command",
+            ((c, profile.http) for c, profile in profiles.items()),
+        )
+        lines.append("# HELP asahi_command_phase_duration_seconds Command latency per invocation phase")
+        lines.append("# TYPE asahi_command_phase_duration_seconds histogram")
+        for command, profile in profiles.items():
+            for phase, histogram in profile.phases.items():
+                lines.extend(histogram.render("asahi_command_phase_duration_seconds", command=command, phase=phase))
+        metric(
+            "asahi_gateway_events_total",
+            "counter",
+            "Gateway events received",
+            (({"event": e}, n) for e, n in bot.socket_stats.items()),
+        )
+        metric(
+            "asahi_shard_latency_seconds",
+            "gauge",
+            "Gateway heartbeat latency per shard",
+            (({"shard": s}, latency) for s, latency in bot.latencies if not math.isnan(latency)),
+        )
+        metric("asahi_guilds", "gauge", "Guilds in the cache", [({}, len(bot.guilds))])
+        metric(
+            "asahi_chunked_guilds",
+            "gauge",
+            "Guilds with their full member list cached",
+            [({}, sum(g.chunked for g in bot.guilds))],
+        )
+        metric("asahi_lazy_chunks_total", "counter", "Guilds chunked on demand", [({}, bot.chunker.chunks)])
+        cache = bot.track_cache
+        metric(
+            "asahi_track_cache_lookups_total",
+            "counter",
+            "Track lookups by the tier that answered them",
+            [
+                ({"tier": "memory"}, cache.memory_hits),
+                ({"tier": "database"}, cache.db_hits),
+                ({"tier": "lavalink"}, cache.misses),
+            ],
+        )
+        dispatcher = bot.dispatcher
+        metric(
+            "asahi_dispatch_listeners", "gauge", "Messages with a registered handler", [({}, len(dispatcher.listeners))]
+        )
+        metric(
+            "asahi_dispatch_events_total",
+            "counter",
+            "Reaction and component events routed by the dispatcher",
+            [({"outcome": "dispatched"}, dispatcher.dispatched), ({"outcome": "expired"}, dispatcher.expired)],
+        )
+        matcher = bot.prefix_matcher
+        metric(
+            "asahi_messages_total",
+            "counter",
+            "Messages checked against the prefix filter",
+            [({"result": "dispatched"}, matcher.dispatched), ({"result": "rejected"}, matcher.rejected)],
+        )
+        histograms("asahi_db_query_duration_seconds", "Database query latency", "operation", bot.db.timings.items())
+        histograms(
+            "asahi_db_commit_duration_seconds", "Group commit latency", "database", [("main", bot.db.commit_latency)]
+        )
+        metric("asahi_db_write_queue_depth", "gauge", "Writes waiting for the writer", [({}, bot.db.depth)])
+        metric("asahi_db_commits_total", "counter", "Transactions committed by the writer", [({}, bot.db.commits)])
+        metric("asahi_db_writes_total", "counter", "Writes committed by the writer", [({}, bot.db.batched_writes)])
+        histograms(
+            "asahi_upstream_request_duration_seconds",
+            "Upstream API request latency",
+            "host",
+            ((host, stats.histogram) for host, stats in bot.web.stats.items()),
+        )
+        metric(
+            "asahi_upstream_errors_total",
+            "counter",
+            "Failed upstream API requests",
+            (({"host": host}, stats.errors) for host, stats in bot.web.stats.items()),
+        )
+        nodes = bot.node_pool.nodes
+        metric(
+            "asahi_lavalink_players",
+            "gauge",
+            "Players connected per Lavalink node",
+            (({"node": name}, node.player_count) for name, node in nodes.items()),
+        )
+        metric(
+            "asahi_lavalink_playing_players",
+            "gauge",
+            "Players currently playing per Lavalink node",
+            (({"node": name}, sum(p.is_playing for p in node.players.values())) for name, node in nodes.items()),
+        )
+        lavalink = bot.lavalink
+        metric(
+            "asahi_lavalink_node_up",
+            "gauge",
+            "Whether the node is connected and taking players",
+            (({"node": name}, int(node.healthy)) for name, node in nodes.items()),
+        )
+        metric(
+            "asahi_lavalink_node_penalty",
+            "gauge",
+            "Load score players are placed by, lower is less loaded",
+            (({"node": name}, lavalink.penalty(node)) for name, node in nodes.items()),
+        )
+        metric(
+            "asahi_lavalink_player_migrations_total",
+            "counter",
+            "Players moved to another node after theirs went down",
+            [({}, lavalink.migrations)],
+        )
+        playback = bot.playback_stats
+        histograms(
+            "asahi_playback_gap_seconds",
+            "Time from a track ending to the next one starting",
+            "cluster",
+            [(str(bot.cluster_id), playback.gaps)],
+        )
+        metric(
+            "asahi_playback_next_tracks_total",
+            "counter",
+            "Tracks started after another ended, by whether they were resolved in advance",
+            [({"resolved": "ahead"}, playback.prefetched), ({"resolved": "late"}, playback.resolved_late)],
+        )
+        metric("asahi_players_reclaimed_total", "counter", "Idle players destroyed", [({}, playback.reclaimed)])
+
+        with self.process.oneshot():
+            rss = self.process.memory_info().rss
+            cpu_times = self.process.cpu_times()
+            cpu_seconds = cpu_times.user + cpu_times.system
+            cpu_percent = self.process.cpu_percent()
+        metric("process_resident_memory_bytes", "gauge", "Resident memory size", [({}, rss)])
+        metric("process_cpu_seconds_total", "counter", "User and system CPU time", [({}, cpu_seconds)])
+        metric("process_cpu_percent", "gauge", "CPU usage since the previous scrape", [({}, cpu_percent)])
+
+        writer = bot.log_writer
+        metric("asahi_log_records_dropped_total", "counter", "Log records dropped", [({}, writer.dropped)])
+        metric("asahi_log_queue_depth", "gauge", "Log records waiting to be written", [({}, writer.depth)])
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving /metrics plus liveness and readiness probes"""
+
+    def __init__(self, bot: Asahi, *, host: str = "127.0.0.1", port: int = 8080):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.metrics = Metrics(bot)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.add_routes(
+            [
+                web.get("/metrics", self.serve_metrics),
+                web.get("/health/live", self.live),
+                web.get("/health/ready", self.ready),
+            ]
+        )
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        LOGGER.info(f"metrics;Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def serve_metrics(self, _: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def live(self, _: web.Request) -> web.Response:
+        """The event loop answered, so the process is alive"""
+        return web.Response(text="ok")
+
+    async def ready(self, _: web.Request) -> web.Response:
+        """Ready once every shard is connected and the database is reachable"""
+        bot = self.bot
+        if bot.is_ready() and not bot.is_closed() and bot.db.is_connected:
+            return web.Response(text="ready")
+        return web.Response(text="not ready", status=503)
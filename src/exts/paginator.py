@@ -1,63 +1,214 @@
 from __future__ import annotations
 
-from asyncio import TimeoutError
-from typing import TYPE_CHECKING
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, Sequence, TYPE_CHECKING, Union
+import inspect
 import re
 
 import discord
 
+from .cache import LRUCache
+
 if TYPE_CHECKING:
     from core import AsahiContext
 
 
 class Paginator:
-    """Very simple implementation of a reaction based paginator"""
+    """Very simple implementation of a reaction based paginator
+
+    Subclasses can override `page_count` and `get_page` to build pages lazily instead of passing embeds.
+    """
 
     def __init__(
         self,
-        embeds: list[discord.Embed],
+        embeds: Optional[list[discord.Embed]] = None,
         timeout: int = 60,
     ):
-        self.embeds = embeds
+        self.embeds = embeds or []
         self.timeout = timeout
         self._emojis = ["⬅️", "🛑", "➡️"]
         self._index = 0
 
+    @property
+    def page_count(self) -> int:
+        return len(self.embeds)
+
+    async def get_page(self, index: int) -> discord.Embed:
+        return self.embeds[index]
+
     async def start(self, ctx: AsahiContext):
-        """Start the paginator"""
-        msg = await ctx.send(embed=self.embeds[0])
+        """Start the paginator, reactions are routed to it by the bot's dispatcher until it times out"""
+        msg = await ctx.send(embed=await self.get_page(0))
+        if self.page_count == 1:
+            return
         for e in self._emojis:
             await msg.add_reaction(e)
 
-        def check(reaction: discord.Reaction, user: discord.User):
-            return ctx.author == user and reaction.message == msg
-
-        while True:
-            try:
-                reaction, _ = await ctx.bot.wait_for("reaction_add", timeout=self.timeout, check=check)
-                reaction: discord.Reaction
-            except TimeoutError:
-                break
-            match str(reaction.emoji):
+        async def on_reaction(payload: discord.RawReactionActionEvent) -> None:
+            match str(payload.emoji):
                 case "⬅️":
                     await self.page_left(msg)
                 case "➡️":
                     await self.page_right(msg)
                 case "🛑":
+                    ctx.bot.dispatcher.unregister(msg.id)
                     await msg.clear_reactions()
-                    break
+
+        ctx.bot.dispatcher.register(msg, users={ctx.author.id}, on_reaction=on_reaction, timeout=self.timeout)
 
     async def page_left(self, msg: discord.Message):
         """Page the paginator to the left"""
         if self._index == 0:
             return
         self._index -= 1
-        await msg.edit(embed=self.embeds[self._index])
+        await msg.edit(embed=await self.get_page(self._index))
 
     async def page_right(self, msg: discord.Message):
         """Page the paginator to the right"""
-        if self._index == len(self.embeds) - 1:
+        if self._index >= self.page_count - 1:  # The count can shrink while paging
             return
         else:
             self._index += 1
-            await msg.edit(embed=self.embeds[self._index])
+            await msg.edit(embed=await self.get_page(self._index))
+
+
+Page = Union[discord.Embed, Callable[[], Union[discord.Embed, Awaitable[discord.Embed]]]]
+
+
+class PageSource:
+    """Pages for a `ButtonPaginator`, rendered only when they're viewed
+
+    Pages are embeds or callables (sync or async) returning one. They can be given as a sequence, or as a sync
+    or async iterator that is only advanced as far as the furthest page viewed. Rendered pages are kept in a
+    small LRU so paging back and forth doesn't render twice.
+    """
+
+    def __init__(
+        self,
+        pages: Union[Sequence[Page], Iterator[Page], AsyncIterator[Page]],
+        *,
+        count: Optional[int] = None,
+        cache_size: int = 8,
+    ):
+        self._iterator: Optional[Union[Iterator[Page], AsyncIterator[Page]]] = None
+        if isinstance(pages, (Iterator, AsyncIterator)):
+            self._iterator = pages
+            self._pages: list[Page] = []
+        else:
+            self._pages = list(pages)
+        self._count = count if self._iterator else len(self._pages)
+        self._cache: LRUCache[int, discord.Embed] = LRUCache(cache_size)
+
+    @property
+    def count(self) -> Optional[int]:
+        """Number of pages, None while an iterator source hasn't been exhausted and no count was given"""
+        return self._count
+
+    def rendered(self, index: int) -> bool:
+        """Whether `get(index)` is answered from the cache, without rendering the page"""
+        return index in self._cache
+
+    async def _pull(self, index: int) -> None:
+        while self._iterator is not None and len(self._pages) <= index:
+            try:
+                if isinstance(self._iterator, AsyncIterator):
+                    page = await self._iterator.__anext__()
+                else:
+                    page = next(self._iterator)
+            except (StopIteration, StopAsyncIteration):
+                self._iterator = None
+                self._count = len(self._pages)
+                return
+            self._pages.append(page)
+
+    async def get(self, index: int) -> Optional[discord.Embed]:
+        """Render page `index`, None if there is no such page"""
+        if (embed := self._cache.get(index)) is not None:
+            return embed
+        await self._pull(index)
+        if index >= len(self._pages):
+            return None
+        page = self._pages[index]
+        if callable(page):
+            page = page()
+            if inspect.isawaitable(page):
+                page = await page
+        self._cache.set(index, page)
+        return page
+
+
+class ButtonPaginator(discord.ui.View):
+    """Paginator on a single message driven by buttons, rendering pages from a `PageSource` on demand"""
+
+    def __init__(self, source: Union[PageSource, Sequence[Page]], *, timeout: int = 60):
+        super().__init__(timeout=timeout)
+        self.source = source if isinstance(source, PageSource) else PageSource(source)
+        self.index = 0
+        self.ctx: Optional[AsahiContext] = None
+        self.message: Optional[discord.Message] = None
+
+    async def start(self, ctx: AsahiContext) -> None:
+        self.ctx = ctx
+        embed = await self.source.get(0)
+        if self.source.count is None:
+            await self.source.get(1)  # Learns whether there's a second page for iterator sources
+        if self.source.count == 1:
+            self.message = await ctx.send(embed=embed)
+            return self.stop()
+        self._update_buttons()
+        self.message = await ctx.send(embed=embed, view=self)
+
+    def _update_buttons(self) -> None:
+        count = self.source.count
+        self.previous.disabled = self.index == 0
+        self.next.disabled = count is not None and self.index >= count - 1
+        self.page.label = f"{self.index + 1}/{count or '?'}"
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.ctx.author.id:
+            await interaction.response.send_message("You are not able to use this paginator", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self) -> None:
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    async def _show(self, interaction: discord.Interaction, index: int) -> None:
+        lookahead = self.source.count is None
+        if not self.source.rendered(index) or (lookahead and not self.source.rendered(index + 1)):
+            await interaction.response.defer()  # Rendering might outlast the 3 seconds Discord waits for an answer
+        if (embed := await self.source.get(index)) is None:
+            self._update_buttons()  # The iterator ran out, the count is known now
+            return await self._edit(interaction, view=self)
+        self.index = index
+        if lookahead:
+            await self.source.get(index + 1)  # Finds out whether this is the last page
+        self._update_buttons()
+        await self._edit(interaction, embed=embed, view=self)
+
+    @staticmethod
+    async def _edit(interaction: discord.Interaction, **kwargs) -> None:
+        if interaction.response.is_done():
+            await interaction.edit_original_response(**kwargs)
+        else:
+            await interaction.response.edit_message(**kwargs)
+
+    @discord.ui.button(emoji="⬅️", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
+        await self._show(interaction, self.index - 1)
+
+    @discord.ui.button(label="1/1", style=discord.ButtonStyle.secondary, disabled=True)
+    async def page(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
+        pass
+
+    @discord.ui.button(emoji="➡️", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
+        await self._show(interaction, self.index + 1)
+
+    @discord.ui.button(emoji="🛑", style=discord.ButtonStyle.danger)
+    async def close(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
+        await interaction.response.edit_message(view=None)
+        self.stop()
@@ -0,0 +1,484 @@
+from __future__ import annotations
+
+from typing import Any, Hashable, Iterable, Iterator, Optional, Union
+import random
+import sys
+
+from pomice import LoopMode, Queue, QueueEmpty, QueueException, QueueFull, SearchType, Track
+import discord
+
+
+class QueuedTrack:
+    """What the queue keeps of a track: the encoded track, what's shown of it and who asked for it
+
+    Unlike a pomice Track it doesn't hold on to the command context, and through it the message and everything
+    that points to. `to_track` builds the full track when it's about to play. Spotify tracks that weren't searched
+    on Lavalink yet keep their search type and ISRC to be resolved with.
+    """
+
+    __slots__ = (
+        "track_id",
+        "title",
+        "author",
+        "length",
+        "uri",
+        "identifier",
+        "thumbnail",
+        "requester_id",
+        "search_type",
+        "isrc",
+        "is_stream",
+    )
+
+    def __init__(
+        self,
+        track_id: str,
+        title: str,
+        author: str,
+        length: int,
+        uri: Optional[str],
+        *,
+        identifier: Optional[str] = None,
+        thumbnail: Optional[str] = None,
+        requester_id: Optional[int] = None,
+        search_type: Optional[SearchType] = None,
+        isrc: Optional[str] = None,
+        is_stream: bool = False,
+    ):
+        self.track_id = track_id
+        self.title = title
+        self.author = author
+        self.length = length
+        self.uri = uri
+        self.identifier = identifier
+        self.thumbnail = thumbnail  # Only when the source gave one, YouTube's are derived from the identifier
+        self.requester_id = requester_id
+        self.search_type = search_type
+        self.isrc = isrc
+        self.is_stream = is_stream
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, QueuedTrack):
+            return NotImplemented
+        return self.track_id == other.track_id and self.requester_id == other.requester_id
+
+    def __repr__(self) -> str:
+        return f"<QueuedTrack title={self.title!r} uri=<{self.uri!r}> length={self.length}>"
+
+    @classmethod
+    def from_track(cls, track: Track) -> QueuedTrack:
+        placeholder = track.original is None
+        return cls(
+            track.track_id,
+            track.title,
+            track.author,
+            track.length,
+            track.uri,
+            identifier=track.identifier,
+            thumbnail=track.info.get("thumbnail"),
+            requester_id=track.requester.id if track.requester else None,
+            search_type=track._search_type if placeholder else None,
+            isrc=track.isrc if placeholder else None,
+            is_stream=bool(track.is_stream),
+        )
+
+    @property
+    def resolved(self) -> bool:
+        """Whether Lavalink can play it as is, Spotify tracks have to be searched for first"""
+        return self.search_type is None
+
+    def resolve(self, track: Track) -> None:
+        """Play `track`, the Lavalink search result for this one, in its place"""
+        self.track_id = track.track_id
+        self.search_type = self.isrc = None
+
+    def info(self) -> dict[str, Any]:
+        info = {
+            "title": self.title,
+            "author": self.author,
+            "length": self.length,
+            "uri": self.uri,
+            "identifier": self.identifier,
+            "isStream": self.is_stream,
+            "isSeekable": not self.is_stream,
+            "position": 0,
+        }
+        if self.thumbnail:
+            info["thumbnail"] = self.thumbnail
+        if self.isrc:
+            info["isrc"] = self.isrc
+        return info
+
+    def to_track(self, guild: Optional[discord.Guild] = None) -> Track:
+        if self.resolved:
+            track = Track(track_id=self.track_id, info=self.info())
+        else:
+            track = Track(track_id=self.track_id, info=self.info(), spotify=True, search_type=self.search_type)
+        if self.requester_id is not None:  # Members that left voice aren't cached under the lighter profiles
+            member = guild.get_member(self.requester_id) if guild is not None else None
+            track.requester = member or discord.Object(id=self.requester_id)
+        return track
+
+    def dump(self) -> dict[str, Any]:
+        """JSON safe form, see `load`"""
+        data: dict[str, Any] = {"track": self.track_id, "info": self.info()}
+        if not self.resolved:
+            data["search_type"] = str(self.search_type)
+        if self.requester_id is not None:
+            data["requester"] = self.requester_id
+        return data
+
+    @classmethod
+    def load(cls, data: dict[str, Any]) -> QueuedTrack:
+        info = data["info"]
+        return cls(
+            data["track"],
+            info.get("title"),
+            info.get("author"),
+            info.get("length"),
+            info.get("uri"),
+            identifier=info.get("identifier"),
+            thumbnail=info.get("thumbnail"),
+            requester_id=data.get("requester"),
+            search_type=SearchType(data["search_type"]) if "search_type" in data else None,
+            isrc=info.get("isrc"),
+            is_stream=bool(info.get("isStream")),
+        )
+
+    def memory(self) -> int:
+        """Approximate size in bytes, with the strings it references"""
+        return sys.getsizeof(self) + sum(
+            sys.getsizeof(value) for name in self.__slots__ if isinstance(value := getattr(self, name), str)
+        )
+
+
+class _Node:
+    __slots__ = ("track", "priority", "size", "total", "left", "right")
+
+    def __init__(self, track: QueuedTrack):
+        self.track = track
+        self.priority = random.random()
+        self.size = 1
+        self.total = int(track.length or 0)
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+
+    def update(self) -> _Node:
+        self.size = 1 + _size(self.left) + _size(self.right)
+        self.total = int(self.track.length or 0) + _total(self.left) + _total(self.right)
+        return self
+
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node else 0
+
+
+def _total(node: Optional[_Node]) -> int:
+    return node.total if node else 0
+
+
+def _split(node: Optional[_Node], index: int) -> tuple[Optional[_Node], Optional[_Node]]:
+    """Split into the first `index` tracks and the rest"""
+    if node is None:
+        return None, None
+    if _size(node.left) >= index:
+        left, node.left = _split(node.left, index)
+        return left, node.update()
+    node.right, right = _split(node.right, index - _size(node.left) - 1)
+    return node.update(), right
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return left.update()
+    right.left = _merge(left, right.left)
+    return right.update()
+
+
+def _build(nodes: list[_Node]) -> Optional[_Node]:
+    """Link nodes into a treap keeping their order, in linear time"""
+    stack: list[_Node] = []
+    for node in nodes:
+        node.left = node.right = None
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop().update()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    while len(stack) > 1:
+        stack.pop().update()
+    return stack[0].update() if stack else None
+
+
+def _walk(node: Optional[_Node], start: int = 0) -> Iterator[_Node]:
+    """In order from position `start`, only descending into the part of the tree before it once"""
+    stack: list[_Node] = []
+    while node:
+        if start < _size(node.left):
+            stack.append(node)
+            node = node.left
+        else:
+            start -= _size(node.left) + 1
+            if start < 0:
+                stack.append(node)
+                break
+            node = node.right
+    while stack:
+        node = stack.pop()
+        yield node
+        node = node.right
+        while node:
+            stack.append(node)
+            node = node.left
+
+
+class TrackQueue(Queue):
+    """pomice's queue backed by an implicit treap
+
+    Positional get, insert, remove and move are O(log n), a page of k tracks is O(log n + k), the count and
+    total length are kept on the tree. In queue loop mode tracks aren't consumed, a cursor points at the
+    current one instead. Tracks are stored as `QueuedTrack`, pomice Tracks put in are converted.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, *, overflow: bool = True):
+        super().__init__(max_size, overflow=overflow)
+        self._queue = None  # Unused, every method touching it is overridden
+        self._root: Optional[_Node] = None
+        self._cursor: Optional[int] = None  # Position of the current track while looping the queue
+
+    @staticmethod
+    def _check_track(item: Union[Track, QueuedTrack]) -> QueuedTrack:
+        if isinstance(item, QueuedTrack):
+            return item
+        if isinstance(item, Track):
+            return QueuedTrack.from_track(item)
+        raise TypeError("Only pomice.Track objects are supported.")
+
+    @classmethod
+    def _check_track_container(cls, iterable: Iterable[Union[Track, QueuedTrack]]) -> list[QueuedTrack]:
+        return [cls._check_track(item) for item in iterable]
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[QueuedTrack, list[QueuedTrack]]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                return list(self)[index]
+            return self.slice(start, stop)
+        if not isinstance(index, int):
+            raise ValueError("'int' type required.'")
+        return self._node(index).track
+
+    def __delitem__(self, index: int) -> None:
+        self.remove_at(index)
+
+    def __iter__(self) -> Iterator[QueuedTrack]:
+        return (node.track for node in _walk(self._root))
+
+    def __reversed__(self) -> Iterator[QueuedTrack]:
+        return (self[i] for i in range(self.count - 1, -1, -1))
+
+    def __contains__(self, item: Union[Track, QueuedTrack]) -> bool:
+        item = self._check_track(item)
+        return any(track == item for track in self)
+
+    @property
+    def count(self) -> int:
+        return _size(self._root)
+
+    @property
+    def size(self) -> int:
+        return _size(self._root)
+
+    @property
+    def duration(self) -> int:
+        """Total length of the queued tracks in milliseconds"""
+        return _total(self._root)
+
+    def memory_usage(self) -> int:
+        """Approximate size of the queued tracks and the tree holding them in bytes"""
+        return sum(sys.getsizeof(node) + node.track.memory() for node in _walk(self._root))
+
+    def _position(self, index: int, *, insert: bool = False) -> int:
+        count = self.count + insert
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("Queue index out of range")
+        return index
+
+    def _node(self, index: int) -> _Node:
+        index = self._position(index)
+        node = self._root
+        while True:
+            if index < _size(node.left):
+                node = node.left
+            elif index == _size(node.left):
+                return node
+            else:
+                index -= _size(node.left) + 1
+                node = node.right
+
+    def _get(self) -> QueuedTrack:
+        return self.remove_at(0)
+
+    def _drop(self) -> QueuedTrack:
+        return self.remove_at(-1)
+
+    def _index(self, item: QueuedTrack) -> int:
+        item = self._check_track(item)
+        for index, track in enumerate(self):
+            if track == item:
+                return index
+        raise ValueError(f"{item!r} is not in the queue")
+
+    def _put(self, item: QueuedTrack) -> None:
+        self._root = _merge(self._root, _Node(item))
+
+    def _insert(self, index: int, item: QueuedTrack) -> None:
+        index = min(self._position(index, insert=True) if index < 0 else index, self.count)
+        left, right = _split(self._root, index)
+        self._root = _merge(_merge(left, _Node(item)), right)
+        if self._cursor is not None and index <= self._cursor:
+            self._cursor += 1
+
+    def _remove(self, index: int) -> None:
+        self.remove_at(index)
+
+    def slice(self, start: int, stop: int) -> list[QueuedTrack]:
+        """Tracks from position `start` up to `stop`"""
+        tracks: list[QueuedTrack] = []
+        for node in _walk(self._root, start):
+            if len(tracks) >= stop - start:
+                break
+            tracks.append(node.track)
+        return tracks
+
+    def remove_at(self, index: int) -> QueuedTrack:
+        """Remove and return the track at a position"""
+        index = self._position(index)
+        left, rest = _split(self._root, index)
+        node, right = _split(rest, 1)
+        self._root = _merge(left, right)
+        if self._cursor is not None and index <= self._cursor:
+            self._cursor -= 1  # The next get moves on to whatever took its place
+        return node.track
+
+    def move(self, source: int, destination: int) -> QueuedTrack:
+        """Move a track to another position, the positions of the tracks in between shift by one"""
+        source, destination = self._position(source), self._position(destination)
+        cursor = self._cursor
+        track = self.remove_at(source)
+        self._insert(destination, track)
+        if cursor == source:  # Keep following the current track, the others were shifted by the remove and insert
+            self._cursor = destination
+        return track
+
+    def _rebuild(self, nodes: list[_Node]) -> None:
+        current = self._node(self._cursor) if self._cursor is not None and self._cursor >= 0 else None
+        self._root = _build(nodes)
+        if current is not None:
+            self._cursor = next((i for i, node in enumerate(nodes) if node is current), -1)
+
+    def shuffle(self) -> None:
+        """Shuffle the queue, relinking its nodes rather than copying tracks"""
+        nodes = list(_walk(self._root))
+        random.shuffle(nodes)
+        self._rebuild(nodes)
+
+    def dedupe(self) -> int:
+        """Drop every track that's already queued earlier on, returns how many were removed"""
+        seen: set[Hashable] = set()
+        nodes = []
+        for node in _walk(self._root):
+            key = node.track.uri or node.track.track_id
+            if key not in seen:
+                seen.add(key)
+                nodes.append(node)
+        removed = self.count - len(nodes)
+        if removed:
+            self._rebuild(nodes)
+        return removed
+
+    def get_queue(self) -> list[QueuedTrack]:
+        return list(self)
+
+    def get(self) -> QueuedTrack:
+        if self._loop_mode == LoopMode.TRACK:
+            return self._current_item
+        if self.is_empty:
+            raise QueueEmpty("No items in the queue.")
+        if self._loop_mode == LoopMode.QUEUE:
+            self._cursor = 0 if self._cursor is None else (self._cursor + 1) % self.count
+            item = self[self._cursor]
+        else:
+            item = self._get()
+        self._current_item = item
+        return item
+
+    def pop(self) -> QueuedTrack:
+        if self.is_empty:
+            raise QueueEmpty("No items in the queue.")
+        return self._drop()
+
+    def extend(self, iterable: Iterable[Union[Track, QueuedTrack]], *, atomic: bool = True) -> None:
+        """Add tracks to the end of the queue, building them into a tree of their own that's merged in one go"""
+        if not atomic or self.max_size is not None:  # Track by track, for the overflow and partial add rules
+            return super().extend(iterable, atomic=atomic)
+        self._root = _merge(self._root, _build([_Node(track) for track in self._check_track_container(iterable)]))
+
+    def load(
+        self,
+        tracks: Iterable[QueuedTrack],
+        *,
+        loop_mode: Optional[LoopMode] = None,
+        cursor: Optional[int] = None,
+        current: Optional[QueuedTrack] = None,
+    ) -> None:
+        """Replace the queue with saved tracks, picking up the loop state it was saved in"""
+        self._root = _build([_Node(track) for track in tracks])
+        self._loop_mode = loop_mode
+        self._cursor = cursor if loop_mode == LoopMode.QUEUE and cursor is not None and cursor < self.count else None
+        self._current_item = current
+
+    def upcoming(self, amount: int) -> list[QueuedTrack]:
+        """The tracks `get` is going to return next, in order"""
+        if self._loop_mode == LoopMode.TRACK or not self.count:
+            return []
+        if self._loop_mode != LoopMode.QUEUE:
+            return self.slice(0, amount)
+        start = 0 if self._cursor is None else self._cursor + 1
+        tracks = self.slice(start, start + amount)
+        return tracks + self.slice(0, min(amount - len(tracks), start))  # Wrapping around
+
+    def copy(self) -> TrackQueue:
+        new_queue = self.__class__(max_size=self.max_size, overflow=self._overflow)
+        new_queue._root = _build([_Node(track) for track in self])
+        return new_queue
+
+    def clear(self) -> None:
+        self._root = None
+        self._cursor = None
+
+    def set_loop_mode(self, mode: Optional[LoopMode]) -> None:
+        if self._loop_mode == LoopMode.QUEUE and mode != LoopMode.QUEUE:
+            self._end_queue_loop()
+        self._loop_mode = mode
+        if mode == LoopMode.QUEUE and self._cursor is None and self._current_item is not None:
+            self._insert(0, self._current_item)  # The playing track was taken off the front, put it back
+            self._cursor = 0
+
+    def disable_loop(self) -> None:
+        if not self._loop_mode:
+            raise QueueException("Queue loop is already disabled.")
+        self.set_loop_mode(None)
+
+    def _end_queue_loop(self) -> None:
+        """Drop the tracks that were already played this round, up to and including the current one"""
+        if self._cursor is not None:
+            _, self._root = _split(self._root, self._cursor + 1)
+        self._cursor = None